@@ -1,14 +1,46 @@
+import os
 import torch
 import numpy as np
 import cv2
 import json
+import pymupdf
 from ultralytics import YOLO
+from ultralytics.utils.plotting import colors
+
+from preprocessing import page_size, prepare_page, scale_boxes
+from timings import timings
+
+MODEL_EXTENSIONS = ('.pt', '.onnx')
+OPENVINO_SUFFIX = '_openvino_model'  # Так ultralytics называет папку экспортированной OpenVINO-модели
+
+
+def model_backend(model_path):
+    """Бэкенд инференса по расширению файла: torch (.pt), onnx (.onnx) или openvino (папка *_openvino_model)."""
+    model_path = model_path.rstrip('/\\')
+    if model_path.endswith('.onnx'):
+        return 'onnx'
+    if model_path.endswith(OPENVINO_SUFFIX):
+        return 'openvino'
+    return 'torch'
+
+
+def list_model_files(models_dir):
+    """Все модели в папке, которые умеет загружать load_model."""
+    return sorted(f for f in os.listdir(models_dir)
+                  if f.endswith(MODEL_EXTENSIONS)
+                  or (f.endswith(OPENVINO_SUFFIX) and os.path.isdir(os.path.join(models_dir, f))))
 
 
 def load_model(model_path):
     try:
-        model = YOLO(model_path)
-        print("Model loaded successfully")
+        backend = model_backend(model_path)
+        if backend == 'torch':
+            model = YOLO(model_path)
+        else:
+            # В экспортированных моделях задачу лучше указать явно, ultralytics сам выберет
+            # ONNX Runtime или OpenVINO по расширению, а выход приведёт к тем же Results, что и у .pt
+            model = YOLO(model_path, task='detect')
+        print(f"Model loaded successfully ({backend})")
     except Exception as e:
         print(f"Error loading model: {e}")
         model = None
@@ -24,42 +56,205 @@ def serialize_elements(elements):
     return elements
 
 
-def process_image(image, model):
-    convert_to_612_792 = True  # СМЕНА РАСШИРЕНИЯ, ФЛАГ МОЖНО УБРАТЬ, КОГДА ПОФИКСИМ БАГИ
-    if convert_to_612_792:
-        width, height = image.size
-        if width > height:  # Горизонтальное изображение
-            image = image.resize((792, 612))
-        else:  # Вертикальное изображение
-            image = image.resize((612, 792))
-
-    image_np = np.array(image)  # Преобразуем PIL Image в numpy-формат
-
-    image_np = cv2.cvtColor(image_np, cv2.COLOR_RGB2BGR)
-    results = model(image_np)  # Передаем изображение напрямую в модель
-
-    # Рисуем боксы и метки на изображении
-    annotated_image = results[0].plot()  # Метод plot() рисует боксы и метки
-
-    # Сериализация элементов (координат и меток объектов)
-    elements = []
-    for result in results:
-        boxes = result.boxes.xyxy.cpu().numpy()  # Координаты боксов
-        confidences = result.boxes.conf.cpu().numpy()  # Уверенность
-        classes = result.boxes.cls.cpu().numpy()  # Классы
-
-        for box, confidence, cls in zip(boxes, confidences, classes):
-            x1, y1, x2, y2 = map(int, box)
-            elements.append({
-                "x1": x1,
-                "y1": y1,
-                "x2": x2,
-                "y2": y2,
-                "confidence": float(confidence),
-                "class": result.names[int(cls)]
-            })
+def prepare_image(image):
+    """
+    Приводит страницу к размеру 612x792 (или 792x612) и порядку каналов BGR, как ждёт модель.
+    Принимает байты файла, путь, PIL Image или RGB-массив numpy (например, растеризованную страницу PDF).
+    """
+    return prepare_page(image)[0]
+
+
+def pdf_page_count(pdf_bytes):
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return len(doc)
+
+
+def iter_pdf_pages(pdf_bytes):
+    """
+    Лениво растеризует страницы PDF в RGB-массивы numpy, по одной за раз, без записи PNG на диск.
+    Масштаб подбирается так, чтобы страница сразу получилась размера, на котором работает модель.
+    """
+    doc = pymupdf.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        for page in doc:
+            width, height = page_size(page.rect.width, page.rect.height)
+            matrix = pymupdf.Matrix(width / page.rect.width, height / page.rect.height)
+            with timings.stage("rasterize"):
+                pix = page.get_pixmap(matrix=matrix, alpha=False, colorspace=pymupdf.csRGB)
+                page_np = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+            yield page_np
+    finally:
+        doc.close()
+
+
+def extract_detections(result):
+    """Детекции одной страницы в виде массивов numpy, без поэлементного обхода боксов."""
+    boxes = result.boxes
+    return {
+        "boxes": boxes.xyxy.cpu().numpy().astype(np.float32),  # Координаты боксов, до целых округляет to_columnar
+        "confidences": boxes.conf.cpu().numpy().astype(np.float32),  # Уверенность
+        "classes": boxes.cls.cpu().numpy().astype(np.int32),  # Классы
+        "names": result.names,
+    }
 
+
+def to_columnar(detections):
+    """
+    Компактный колоночный формат: параллельные списки координат, уверенностей и номеров классов,
+    таблица имён классов хранится один раз.
+    """
+    names = detections["names"]
     return {
-        "elements": serialize_elements(elements),
-        "annotated_image": annotated_image
+        "boxes": detections["boxes"].astype(np.int32).tolist(),  # Отбрасываем дробную часть, как int()
+        "confidences": detections["confidences"].tolist(),
+        "classes": detections["classes"].tolist(),
+        "names": [names[i] for i in range(len(names))],
     }
+
+
+def columnar_to_elements(columnar):
+    """Представление колоночного формата в виде привычного списка словарей."""
+    names = columnar["names"]
+    return [{
+        "x1": x1,
+        "y1": y1,
+        "x2": x2,
+        "y2": y2,
+        "confidence": confidence,
+        "class": names[cls]
+    } for (x1, y1, x2, y2), confidence, cls in zip(columnar["boxes"], columnar["confidences"], columnar["classes"])]
+
+
+class AnnotatedImage:
+    """
+    Ленивая разметка страницы: боксы и метки рисуются только по запросу и сразу в нужном размере.
+    Пока render/encode не вызваны, никакого рисования и лишних копий изображения нет.
+    """
+
+    def __init__(self, image, columnar):
+        self.image = image  # Подготовленная страница в BGR, та же, что ушла в модель
+        self.columnar = columnar
+
+    def render(self, max_size=None):
+        """Возвращает RGB-изображение с разметкой, уменьшенное так, чтобы большая сторона была не больше max_size."""
+        return cv2.cvtColor(self._draw(max_size), cv2.COLOR_BGR2RGB)
+
+    def encode(self, max_size=None, fmt=".jpg", quality=85):
+        """Рисует разметку и сразу сжимает её (по умолчанию в JPEG), возвращает байты."""
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality] if fmt in (".jpg", ".jpeg") else []
+        image = self._draw(max_size)
+        with timings.stage("encode"):
+            ok, buffer = cv2.imencode(fmt, image, params)
+        if not ok:
+            raise ValueError(f"Не удалось закодировать изображение в {fmt}")
+        return buffer.tobytes()
+
+    def _draw(self, max_size):
+        with timings.stage("render"):
+            return self._draw_boxes(max_size)
+
+    def _draw_boxes(self, max_size):
+        height, width = self.image.shape[:2]
+        scale = 1.0
+        if max_size and max(height, width) > max_size:
+            scale = max_size / max(height, width)
+            image = cv2.resize(self.image, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+        else:
+            image = self.image.copy()
+
+        thickness = max(1, round(max(image.shape[:2]) / 400))
+        font_scale = thickness / 3
+        names = self.columnar["names"]
+        for box, confidence, cls in zip(self.columnar["boxes"], self.columnar["confidences"], self.columnar["classes"]):
+            x1, y1, x2, y2 = (round(v * scale) for v in box)
+            color = colors(cls, True)
+            cv2.rectangle(image, (x1, y1), (x2, y2), color, thickness)
+
+            label = f"{names[cls]} {confidence:.2f}"
+            (text_width, text_height), baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, 1)
+            top = max(y1 - text_height - baseline, 0)
+            cv2.rectangle(image, (x1, top), (x1 + text_width, top + text_height + baseline), color, -1)
+            cv2.putText(image, label, (x1, top + text_height), cv2.FONT_HERSHEY_SIMPLEX, font_scale,
+                        (255, 255, 255), 1, cv2.LINE_AA)
+        return image
+
+
+def format_output(result, output_format="elements", image=None, scale=None):
+    """
+    Результат одной страницы в формате "elements" (список словарей) или "columnar".
+    Если передано изображение страницы, добавляется ленивая разметка "annotated" (AnnotatedImage).
+    Если передан масштаб scale, координаты переводятся в систему исходного изображения.
+    """
+    with timings.stage("postprocess"):
+        detections = extract_detections(result)
+        columnar = to_columnar(detections)
+        annotated = AnnotatedImage(image, columnar) if image is not None else None
+        if scale is not None:
+            # Масштабируются дробные координаты: после отбрасывания дробной части ошибка выросла бы в scale раз
+            detections["boxes"] = scale_boxes(detections["boxes"], scale)
+            columnar = to_columnar(detections)
+
+        if output_format == "columnar":
+            output = {"columnar": columnar}
+        else:
+            output = {"elements": columnar_to_elements(columnar)}
+        output["annotated"] = annotated
+        return output
+
+
+def process_image(image, model, output_format="elements", annotate=True, original_coords=False, verbose=True):
+    """
+    image: байты файла, путь, PIL Image или RGB-массив numpy.
+    По умолчанию координаты возвращаются в системе страницы 612x792 (как в разметке датасета),
+    с original_coords=True -- в пикселях исходного изображения.
+    verbose=False отключает печать ultralytics на каждый вызов (например, при замерах времени).
+    """
+    image_np, scale = prepare_page(image)
+    with timings.stage("forward"):
+        results = model(image_np, verbose=verbose)  # Передаем изображение напрямую в модель
+
+    # Элементы (координаты и метки объектов) уже собраны из массивов в обычные типы Python.
+    # Разметка не рисуется здесь: "annotated" нарисует её, только если её попросят
+    return format_output(results[0], output_format, image_np if annotate else None,
+                         scale if original_coords else None)
+
+
+def process_images(images, model, batch_size=8, output_format="elements", annotate=False, original_coords=False):
+    """
+    Пакетная обработка нескольких страниц.
+    Страницы подаются в модель пачками по batch_size за один вызов, чтобы накладные
+    расходы на вызов модели делились на всю пачку. Возвращает список результатов
+    в том же формате, что и process_image, в порядке входных изображений.
+    """
+    return list(iter_process_images(images, model, batch_size, output_format, annotate, original_coords))
+
+
+def iter_process_images(images, model, batch_size=8, output_format="elements", annotate=False,
+                        original_coords=False):
+    """
+    То же, что process_images, но отдаёт результаты по мере готовности каждой пачки.
+    images может быть генератором (например, iter_pdf_pages): страницы читаются
+    не раньше, чем понадобятся для очередной пачки.
+    """
+    batch, scales = [], []
+    for image in images:
+        image_np, scale = prepare_page(image)
+        batch.append(image_np)
+        scales.append(scale)
+        if len(batch) == batch_size:
+            yield from process_batch(batch, model, output_format, annotate, scales if original_coords else None)
+            batch, scales = [], []
+    if batch:
+        yield from process_batch(batch, model, output_format, annotate, scales if original_coords else None)
+
+
+def process_batch(batch, model, output_format="elements", annotate=False, scales=None):
+    """
+    Один вызов модели на пачку уже подготовленных (prepare_page) страниц.
+    scales -- масштабы страниц к исходным изображениям, если координаты нужны в их системе.
+    """
+    with timings.stage("forward"):
+        results = model(batch, verbose=False)
+    scales = scales or [None] * len(batch)
+    return [format_output(result, output_format, image if annotate else None, scale)
+            for result, image, scale in zip(results, batch, scales)]
@@ -0,0 +1,185 @@
+import argparse
+import json
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from tqdm import tqdm
+
+from app_utils import columnar_to_elements, prepare_image, process_batch
+from model_registry import get_model
+from result_cache import MAX_CACHE_MB, ResultCache
+from timings import timings
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+BATCH_SIZE = 8
+DECODE_WORKERS = 4
+QUEUE_SIZE = 32  # Сколько готовых страниц/результатов может ждать в очереди между стадиями
+
+_DONE = object()  # Маркер конца очереди
+
+
+def output_path_for(image_file, output_dir):
+    # Расширение сохраняется в имени: у a.png и a.jpg должны быть разные a.png.json и a.jpg.json
+    return os.path.join(output_dir, image_file + '.json')
+
+
+def decode_image(image_path, cache=None, model_path=None):
+    """
+    Стадия 1: чтение и подготовка страницы (выполняется в пуле потоков).
+    Возвращает (страница, ключ кэша, результат из кэша); при попадании в кэш страница не декодируется.
+    """
+    if cache is None:
+        return prepare_image(image_path), None, None
+    with open(image_path, 'rb') as f:
+        data = f.read()
+    key = cache.key(data, model_path, {"source": "image"})
+    cached = cache.get(key)
+    if cached is not None:
+        return None, key, cached
+    return prepare_image(data), key, None
+
+
+def write_json_atomic(path, payload):
+    """Пишет во временный файл и переименовывает, чтобы недописанный JSON не считался готовым."""
+    tmp_path = path + '.tmp'
+    with timings.stage("serialize"):
+        data = json.dumps(payload, ensure_ascii=False, indent=2)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def feed_decoder(image_files, input_dir, pool, decoded, cache=None, model_path=None, stop=None):
+    # Ограниченная очередь не даёт декодеру убежать далеко вперёд модели
+    for image_file in image_files:
+        if stop is not None and stop.is_set():
+            break
+        decoded.put((image_file, pool.submit(decode_image, os.path.join(input_dir, image_file), cache, model_path)))
+    decoded.put(_DONE)
+
+
+def write_results(written, output_dir, progress, errors):
+    """
+    Стадия 3: асинхронная запись результатов на диск.
+    Ошибка записи (нет места, нет прав) кладётся в errors, дальше очередь только вычитывается,
+    чтобы основной поток не повис на put.
+    """
+    while True:
+        item = written.get()
+        if item is _DONE:
+            return
+        if errors:
+            continue
+        image_file, payload = item
+        try:
+            write_json_atomic(output_path_for(image_file, output_dir), payload)
+        except Exception as e:
+            errors.append(e)
+            continue
+        progress.update(1)
+
+
+def run(input_dir, output_dir, model, batch_size=BATCH_SIZE, decode_workers=DECODE_WORKERS, queue_size=QUEUE_SIZE,
+        output_format="elements", cache=None, model_path=None):
+    """
+    Прогоняет модель по всем изображениям папки.
+    Три стадии работают одновременно и связаны ограниченными очередями:
+    чтение/подготовка в пуле потоков -> пакетный вызов модели -> запись JSON в отдельном потоке.
+    Уже обработанные изображения (есть готовый JSON) пропускаются, поэтому прерванный запуск можно продолжить.
+    С кэшем (ResultCache) страницы, которые уже встречались этой модели, не декодируются и не идут в модель.
+    """
+    def payload(columnar):
+        return columnar if output_format == "columnar" else columnar_to_elements(columnar)
+
+    os.makedirs(output_dir, exist_ok=True)
+    image_files = sorted(f for f in os.listdir(input_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+    todo = [f for f in image_files if not os.path.exists(output_path_for(f, output_dir))]
+    print(f"Всего изображений: {len(image_files)}, уже обработано: {len(image_files) - len(todo)}")
+
+    decoded = queue.Queue(maxsize=queue_size)
+    written = queue.Queue(maxsize=queue_size)
+    progress = tqdm(total=len(todo), desc="Обработка изображений")
+    write_errors = []  # Ошибка потока записи, пробрасывается в основном потоке
+    stop = threading.Event()
+
+    with ThreadPoolExecutor(max_workers=decode_workers) as pool:
+        feeder = threading.Thread(target=feed_decoder,
+                                  args=(todo, input_dir, pool, decoded, cache, model_path, stop), daemon=True)
+        writer = threading.Thread(target=write_results, args=(written, output_dir, progress, write_errors),
+                                  daemon=True)
+        feeder.start()
+        writer.start()
+
+        # Стадия 2: пакетный вызов модели в основном потоке
+        batch_files, batch_keys, batch = [], [], []
+        while True:
+            if write_errors:
+                # Запись сломалась: останавливаем чтение и дочитываем уже поставленные в очередь страницы
+                stop.set()
+                while decoded.get() is not _DONE:
+                    pass
+                break
+            item = decoded.get()
+            if item is not _DONE:
+                image_file, future = item
+                try:
+                    page, cache_key, cached = future.result()
+                except Exception as e:
+                    print(f"Ошибка чтения {image_file}: {e}")
+                    progress.update(1)
+                else:
+                    if cached is not None:
+                        written.put((image_file, payload(cached)))
+                    else:
+                        batch.append(page)
+                        batch_files.append(image_file)
+                        batch_keys.append(cache_key)
+            if batch and (len(batch) == batch_size or item is _DONE):
+                outputs = process_batch(batch, model, "columnar")
+                for image_file, cache_key, output in zip(batch_files, batch_keys, outputs):
+                    if cache is not None:
+                        cache.put(cache_key, output["columnar"])
+                    written.put((image_file, payload(output["columnar"])))
+                batch_files, batch_keys, batch = [], [], []
+            if item is _DONE:
+                break
+
+        written.put(_DONE)
+        writer.join()
+    progress.close()
+    if write_errors:
+        raise write_errors[0]
+    if cache is not None:
+        print(f"Кэш результатов: {cache.stats()}")
+    if timings.enabled:
+        print(json.dumps(timings.snapshot(), indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетное определение элементов для папки с изображениями страниц")
+    parser.add_argument("input_dir", help="Папка с изображениями страниц")
+    parser.add_argument("output_dir", help="Папка для JSON с результатами")
+    parser.add_argument("--model", required=True, help="Путь к модели")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--decode-workers", type=int, default=DECODE_WORKERS)
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    parser.add_argument("--format", choices=["elements", "columnar"], default="elements",
+                        help="Формат JSON: список элементов или компактный колоночный")
+    parser.add_argument("--cache-dir", default=None, help="Папка кэша результатов (по умолчанию кэш выключен)")
+    parser.add_argument("--cache-max-mb", type=float, default=MAX_CACHE_MB)
+    parser.add_argument("--timings", action="store_true", help="Напечатать время по стадиям обработки")
+    args = parser.parse_args()
+    timings.enabled = args.timings
+
+    model = get_model(args.model)
+    if model is None:
+        raise SystemExit("Не удалось загрузить модель")
+    cache = ResultCache(args.cache_dir, int(args.cache_max_mb * 2 ** 20)) if args.cache_dir else None
+    run(args.input_dir, args.output_dir, model, args.batch_size, args.decode_workers, args.queue_size, args.format,
+        cache, args.model)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+import torch
+from PIL import Image, ImageDraw
+
+from app_utils import load_model, model_backend, process_image, process_images
+from timings import timings
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+NUM_PAGES = 32
+SEED = 0
+LATENCY_ROUNDS = 3
+BATCH_SIZES = [1, 2, 4, 8, 16]
+
+
+def synthetic_pages(num_pages=NUM_PAGES, seed=SEED):
+    """
+    Фиксированный набор страниц-заглушек: строки «текста», блоки «картинок» и «таблиц» на белом листе
+    300 DPI, каждая пятая страница горизонтальная. Страницы кодируются в PNG, чтобы в замер
+    попадало и декодирование, как при реальной загрузке.
+    """
+    rng = np.random.default_rng(seed)
+    pages = []
+    for page_num in range(num_pages):
+        width, height = (3300, 2550) if page_num % 5 == 4 else (2550, 3300)
+        image = Image.new("RGB", (width, height), "white")
+        draw = ImageDraw.Draw(image)
+        y = int(rng.integers(150, 300))
+        while y < height - 300:
+            if rng.random() < 0.15:
+                block_height = int(rng.integers(300, 900))
+                x1 = int(rng.integers(150, width // 3))
+                draw.rectangle([x1, y, width - x1, y + block_height], fill=tuple(int(c) for c in rng.integers(60, 200, 3)))
+                y += block_height + 60
+            else:
+                line_end = int(rng.integers(width // 2, width - 150))
+                draw.rectangle([150, y, line_end, y + 28], fill=(30, 30, 30))
+                y += int(rng.integers(45, 70))
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        pages.append(buffer.getvalue())
+    return pages
+
+
+def percentiles_ms(values):
+    values = np.asarray(values) * 1000
+    return {f"p{q}": round(float(np.percentile(values, q)), 2) for q in (50, 95, 99)}
+
+
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux отдаёт килобайты, macOS -- байты
+        return round(peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10, 1)
+    except ImportError:
+        import psutil
+        return round(psutil.Process().memory_info().peak_wset / 2 ** 20, 1)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(model_path, num_pages=NUM_PAGES, seed=SEED, batch_sizes=BATCH_SIZES, thread_counts=None,
+                  rounds=LATENCY_ROUNDS):
+    pages = synthetic_pages(num_pages, seed)
+    backend = model_backend(model_path)
+    # torch.set_num_threads влияет только на .pt; ONNX Runtime и OpenVINO в ultralytics сами выбирают
+    # число потоков, поэтому для них пропускная способность меряется один раз, без перебора потоков
+    thread_sweep = backend == "torch"
+    if thread_sweep:
+        thread_counts = thread_counts or sorted({1, 2, 4, os.cpu_count() or 1})
+    else:
+        thread_counts = [None]
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "model": os.path.basename(model_path.rstrip('/\\')),
+            "backend": backend,
+            "thread_sweep": thread_sweep,
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "cpu_count": os.cpu_count(),
+            "pages": num_pages,
+            "seed": seed,
+        }
+    }
+
+    # Холодный старт: загрузка модели с диска и первый вызов (инициализация бэкенда)
+    start = time.perf_counter()
+    model = load_model(model_path)
+    loaded = time.perf_counter()
+    process_image(pages[0], model, annotate=False, verbose=False)
+    report["cold_start_s"] = {
+        "load": round(loaded - start, 3),
+        "first_inference": round(time.perf_counter() - loaded, 3),
+    }
+
+    # Задержка одной страницы через process_image, заодно с разбивкой по стадиям
+    latencies = []
+    timings.reset()
+    timings.enabled = True
+    for _ in range(rounds):
+        for page in pages:
+            start = time.perf_counter()
+            process_image(page, model, annotate=False, verbose=False)
+            latencies.append(time.perf_counter() - start)
+    timings.enabled = False
+    report["latency_ms"] = percentiles_ms(latencies)
+    report["stages"] = timings.snapshot()
+
+    # Пропускная способность пакетного пути в зависимости от размера пачки и числа потоков torch
+    default_threads = torch.get_num_threads()
+    throughput = []
+    for threads in thread_counts:
+        if threads is not None:
+            torch.set_num_threads(threads)
+        for batch_size in batch_sizes:
+            process_images(pages[:batch_size], model, batch_size=batch_size)  # Прогрев на этой форме пачки
+            start = time.perf_counter()
+            process_images(pages, model, batch_size=batch_size)
+            elapsed = time.perf_counter() - start
+            throughput.append({
+                "threads": threads,
+                "batch_size": batch_size,
+                "pages_per_sec": round(len(pages) / elapsed, 2),
+            })
+            print(f"threads={threads or 'auto':<4} batch={batch_size:<3} {len(pages) / elapsed:8.2f} стр/с")
+    torch.set_num_threads(default_threads)
+    report["throughput"] = throughput
+
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def compare(report, baseline):
+    """Печатает изменения относительно прошлого отчёта (например, с предыдущего коммита)."""
+    def change(new, old):
+        return f"{old} -> {new} ({(new - old) / old * 100:+.1f}%)" if old else f"{old} -> {new}"
+
+    print(f"\nСравнение с {baseline['meta'].get('commit')}:")
+    for q, value in report["latency_ms"].items():
+        print(f"  latency {q}, мс: {change(value, baseline['latency_ms'][q])}")
+    old_throughput = {(row["threads"], row["batch_size"]): row["pages_per_sec"] for row in baseline["throughput"]}
+    for row in report["throughput"]:
+        old = old_throughput.get((row["threads"], row["batch_size"]))
+        if old is not None:
+            print(f"  threads={row['threads']} batch={row['batch_size']}, стр/с: {change(row['pages_per_sec'], old)}")
+    print(f"  peak RSS, МБ: {change(report['peak_rss_mb'], baseline['peak_rss_mb'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк инференса: задержка, пропускная способность, память")
+    parser.add_argument("model", help="Путь к модели (.pt, .onnx или папка OpenVINO)")
+    parser.add_argument("--output", default="benchmark.json", help="Куда сохранить JSON с результатами")
+    parser.add_argument("--compare", default=None, help="JSON прошлого запуска для сравнения")
+    parser.add_argument("--pages", type=int, default=NUM_PAGES)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--rounds", type=int, default=LATENCY_ROUNDS)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=BATCH_SIZES)
+    parser.add_argument("--threads", type=int, nargs="+", default=None,
+                        help="Число потоков torch (по умолчанию 1, 2, 4 и все ядра); только для моделей .pt")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.model, args.pages, args.seed, args.batch_sizes, args.threads, args.rounds)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(json.dumps({key: report[key] for key in ("cold_start_s", "latency_ms", "peak_rss_mb")}, indent=2))
+    print(f"Результаты сохранены в {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import argparse
+import os
+
+from ultralytics import YOLO
+
+from app_utils import load_model, process_image
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.path.join(BASE_DIR, "../models/")
+IMGSZ = 640  # Размер входа, на котором обучались модели
+
+
+def export_checkpoint(pt_path, fmt, imgsz=IMGSZ):
+    """
+    Экспортирует .pt в ONNX или OpenVINO рядом с исходным файлом.
+    dynamic=True оставляет размер пачки динамическим, чтобы работал process_images.
+    """
+    exported_path = YOLO(pt_path).export(format=fmt, imgsz=imgsz, dynamic=True)
+    print(f"{os.path.basename(pt_path)} -> {exported_path}")
+    return exported_path
+
+
+def check_parity(pt_path, exported_path, image_path):
+    """Сравнивает результаты исходной и экспортированной модели на одном изображении."""
+    reference = process_image(image_path, load_model(pt_path), annotate=False)["elements"]
+    exported = process_image(image_path, load_model(exported_path), annotate=False)["elements"]
+
+    print(f"  элементов: {len(reference)} (.pt) / {len(exported)} (экспорт)")
+    if len(reference) != len(exported):
+        return
+    key = lambda e: (e["class"], e["x1"], e["y1"])
+    max_box_diff = max_conf_diff = 0
+    for ref, exp in zip(sorted(reference, key=key), sorted(exported, key=key)):
+        max_box_diff = max(max_box_diff, *(abs(ref[c] - exp[c]) for c in ("x1", "y1", "x2", "y2")))
+        max_conf_diff = max(max_conf_diff, abs(ref["confidence"] - exp["confidence"]))
+    print(f"  макс. расхождение координат: {max_box_diff} px, уверенности: {max_conf_diff:.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Экспорт моделей из models/ в ONNX / OpenVINO для инференса на CPU")
+    parser.add_argument("--models-dir", default=MODELS_DIR)
+    parser.add_argument("--format", nargs="+", choices=["onnx", "openvino"], default=["onnx"])
+    parser.add_argument("--imgsz", type=int, default=IMGSZ)
+    parser.add_argument("--check-image", default=None,
+                        help="Изображение страницы для проверки совпадения результатов с .pt")
+    args = parser.parse_args()
+
+    pt_files = sorted(f for f in os.listdir(args.models_dir) if f.endswith('.pt'))
+    for pt_file in pt_files:
+        pt_path = os.path.join(args.models_dir, pt_file)
+        for fmt in args.format:
+            try:
+                exported_path = export_checkpoint(pt_path, fmt, args.imgsz)
+            except Exception as e:
+                print(f"Ошибка экспорта {pt_file} в {fmt}: {e}")
+                continue
+            if args.check_image:
+                check_parity(pt_path, exported_path, args.check_image)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,17 @@
 import streamlit as st
-from PIL import Image
+import base64
+import hashlib
 import json
 import os
-from app_utils import load_model, process_image
+from app_utils import (AnnotatedImage, columnar_to_elements, iter_pdf_pages, iter_process_images, list_model_files,
+                       model_backend, pdf_page_count, prepare_image, process_image)
+from model_registry import get_model, model_identity, registry
+from result_cache import get_result_cache
+from timings import timings
+
+MAX_SESSION_RESULTS = 5  # Сколько последних результатов хранить в сессии пользователя
+PDF_BATCH_SIZE = 4  # Сколько страниц PDF подавать в модель за один вызов
+PREVIEW_MAX_SIZE = 600  # Большая сторона превью с разметкой, в пикселях (меньше страницы модели 612x792)
 
 
 # Определение корневой директории проекта
@@ -10,52 +19,211 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Загрузка модели
 models_dir = os.path.join(BASE_DIR, "../models/")
-model_files = [f for f in os.listdir(models_dir) if f.endswith('.pt')]
+model_files = list_model_files(models_dir)
 
-# Выбор модели через Streamlit
-selected_model_file = st.selectbox("Выберите модель", model_files)
+# Выбор модели через Streamlit (бэкенд -- PyTorch, ONNX Runtime или OpenVINO -- определяется по расширению)
+selected_model_file = st.selectbox("Выберите модель", model_files,
+                                   format_func=lambda f: f"{f} ({model_backend(f)})")
 
-# Загрузка выбранной модели
+# Загрузка выбранной модели (из общего реестра, чтобы не грузить её заново при каждом перезапуске)
 model_path = os.path.join(models_dir, selected_model_file)
-model = load_model(model_path)
+model = get_model(model_path)
+if model is None:
+    st.error("Не удалось загрузить модель.")
+    st.stop()
+
+# Общий для всех пользователей кэш результатов на диске: повторно загруженные страницы и документы
+# не прогоняются через модель, даже если это другой пользователь или сессия.
+# Кэш -- только ускорение: если его папку не создать (нет прав, нет места), приложение работает без него
+try:
+    result_cache = get_result_cache()
+except OSError as e:
+    print(f"Кэш результатов отключён: {e}")
+    result_cache = None
+
+with st.sidebar.expander("Кэш моделей"):
+    st.json(registry.stats())
+with st.sidebar.expander("Кэш результатов"):
+    st.json(result_cache.stats() if result_cache is not None else {"enabled": False})
+
+# Замер времени по стадиям общий для процесса (учитывает запросы всех пользователей)
+timings.enabled = st.sidebar.checkbox("Замерять время по стадиям", value=timings.enabled)
 
 st.title("Компьютерное зрение: определение элементов документа")
 
-# Загрузка изображения
-uploaded_file = st.file_uploader("Загрузите изображение", type=["png"])
 
-if uploaded_file:
-    # Открываем изображение
-    with st.expander("Показать загруженное изображение"):
-        image = Image.open(uploaded_file)
-        st.image(image, caption="Загруженное изображение", use_container_width=True)
-
-    # Обработка изображения
-    with st.spinner("Обработка изображения..."):
-        results = process_image(image, model)
-        if results is None:
-            st.error("Ошибка обработки изображения. Пожалуйста, попробуйте еще раз.")
-            st.stop()
-        st.success("Обработка завершена!")  # Отображаем сообщение внутри блока spinner
+def page_result(columnar, annotated):
+    """Рисует разметку один раз в виде сжатого превью, чтобы в сессии не хранить массивы изображений."""
+    return {
+        "elements": columnar_to_elements(columnar),
+        "preview": annotated.encode(max_size=PREVIEW_MAX_SIZE),
+    }
 
-    # Сохранение JSON в директорию ./annotations
-    json_file_name = os.path.join(BASE_DIR, "latest_output.json")
-    with open(json_file_name, "w") as f:
-        json.dump(results["elements"], f, indent=4)
 
+def cached_page_result(columnar, preview):
+    """Результат страницы из кэша: превью уже закодировано, страницу не нужно ни декодировать, ни рисовать."""
+    return {
+        "elements": columnar_to_elements(columnar),
+        "preview": base64.b64decode(preview),
+    }
+
+
+def encode_preview(result):
+    return base64.b64encode(result["preview"]).decode("ascii")
+
+
+def cache_key(file_bytes, params):
+    return result_cache.key(file_bytes, model_path, params) if result_cache is not None else None
+
+
+def preview_cache_key(file_bytes, source):
+    """Превью хранятся в кэше отдельно от результатов, тем же ключом с размером превью в параметрах."""
+    return cache_key(file_bytes, {"source": source, "preview": PREVIEW_MAX_SIZE})
+
+
+def cache_get(key):
+    return result_cache.get(key) if key is not None else None
+
+
+def cache_put(key, value):
+    """Ошибка записи в кэш (например, закончилось место) не должна ронять страницу с готовым результатом."""
+    if key is None:
+        return
+    try:
+        result_cache.put(key, value)
+    except OSError as e:
+        print(f"Не удалось записать результат в кэш: {e}")
+
+
+def show_page_result(result, caption="Размеченное изображение"):
+    """Показывает JSON и размеченное изображение одной страницы."""
     # Отображение JSON
     with st.expander("Показать результаты в формате JSON"):
-        st.json(results["elements"])
+        st.json(result["elements"])
 
     # Отображение размеченного изображения
-    annotated_image = Image.fromarray(results["annotated_image"])
-    st.image(annotated_image, caption="Размеченное изображение", use_container_width=True)
+    st.image(result["preview"], caption=caption, use_container_width=True)
+
+
+def remember_results(session_results, results_key, results):
+    session_results[results_key] = results
+    while len(session_results) > MAX_SESSION_RESULTS:
+        session_results.pop(next(iter(session_results)))
+
+
+# Загрузка изображения или PDF
+uploaded_file = st.file_uploader("Загрузите изображение или PDF", type=["png", "pdf"])
+
+if uploaded_file:
+    # Результаты запоминаются в сессии по хэшу содержимого файла и выбранной модели,
+    # поэтому перезапуски скрипта (раскрытие блоков, скачивание) не гоняют модель заново
+    file_bytes = uploaded_file.getvalue()
+    results_key = (hashlib.sha256(file_bytes).hexdigest(), model_identity(model_path))
+    session_results = st.session_state.setdefault("results", {})
+    json_file_name = os.path.join(BASE_DIR, "latest_output.json")
+    results = session_results.get(results_key)
+    is_pdf = uploaded_file.name.lower().endswith(".pdf")
+
+    if is_pdf:
+        # Страницы растеризуются лениво и обрабатываются пачками, каждая страница
+        # показывается сразу, как только готова её пачка, не дожидаясь конца документа
+        if results is None:
+            results = []
+            columnar_key = cache_key(file_bytes, {"source": "pdf"})
+            preview_key = preview_cache_key(file_bytes, "pdf")
+            cached_pages = cache_get(columnar_key)
+            cached_previews = cache_get(preview_key) if cached_pages is not None else None
+            if cached_previews is not None:
+                # Документ и его превью уже в кэше: PDF не растеризуется вовсе
+                page_outputs = ((columnar, cached_page_result(columnar, preview))
+                                for columnar, preview in zip(cached_pages, cached_previews))
+            elif cached_pages is not None:
+                # Документ уже обрабатывался: модель не нужна, страницы растеризуются только для превью
+                page_outputs = ((columnar, page_result(columnar, AnnotatedImage(prepare_image(page), columnar)))
+                                for page, columnar in zip(iter_pdf_pages(file_bytes), cached_pages))
+            else:
+                page_outputs = ((output["columnar"], page_result(output["columnar"], output["annotated"]))
+                                for output in iter_process_images(iter_pdf_pages(file_bytes), model,
+                                                                  batch_size=PDF_BATCH_SIZE, output_format="columnar",
+                                                                  annotate=True))
+
+            page_count = len(cached_pages) if cached_pages is not None else pdf_page_count(file_bytes)
+            progress = st.progress(0.0, text="Обработка страниц...")
+            columnar_pages = []
+            for page_num, (columnar, result) in enumerate(page_outputs, start=1):
+                st.subheader(f"Страница {page_num}")
+                show_page_result(result, caption=f"Страница {page_num}")
+                results.append(result)
+                columnar_pages.append(columnar)
+                progress.progress(page_num / page_count, text=f"Обработано страниц: {page_num} из {page_count}")
+            progress.empty()
+            st.success("Обработка завершена!")
+            if cached_pages is None:
+                cache_put(columnar_key, columnar_pages)
+            if cached_previews is None:
+                cache_put(preview_key, [encode_preview(result) for result in results])
+            remember_results(session_results, results_key, results)
+        else:
+            for page_num, result in enumerate(results, start=1):
+                st.subheader(f"Страница {page_num}")
+                show_page_result(result, caption=f"Страница {page_num}")
+
+        output = [{"page": page_num, "elements": result["elements"]}
+                  for page_num, result in enumerate(results, start=1)]
+        with open(json_file_name, "w") as f:
+            json.dump(output, f, indent=4)
+    else:
+        # Открываем изображение
+        with st.expander("Показать загруженное изображение"):
+            st.image(file_bytes, caption="Загруженное изображение", use_container_width=True)
+
+        if results is None:
+            columnar_key = cache_key(file_bytes, {"source": "image"})
+            preview_key = preview_cache_key(file_bytes, "image")
+            columnar = cache_get(columnar_key)
+            preview = cache_get(preview_key) if columnar is not None else None
+            if preview is not None:
+                # Страница и её превью уже в кэше: картинка не декодируется вовсе
+                annotated = None
+            elif columnar is not None:
+                # Страница уже обрабатывалась: модель не нужна, картинка декодируется только для превью
+                annotated = AnnotatedImage(prepare_image(file_bytes), columnar)
+            else:
+                # Обработка изображения
+                with st.spinner("Обработка изображения..."):
+                    # Страница декодируется из байтов сразу в нужном размере (см. preprocessing.py)
+                    processed = process_image(file_bytes, model, output_format="columnar")
+                    if processed is None:
+                        st.error("Ошибка обработки изображения. Пожалуйста, попробуйте еще раз.")
+                        st.stop()
+                    columnar, annotated = processed["columnar"], processed["annotated"]
+                    st.success("Обработка завершена!")  # Отображаем сообщение внутри блока spinner
+                cache_put(columnar_key, columnar)
+
+            if annotated is None:
+                results = cached_page_result(columnar, preview)
+            else:
+                results = page_result(columnar, annotated)
+                cache_put(preview_key, encode_preview(results))
+            remember_results(session_results, results_key, results)
+
+            # Сохранение JSON в директорию ./annotations
+            with open(json_file_name, "w") as f:
+                json.dump(results["elements"], f, indent=4)
+
+        show_page_result(results)
+        output = results["elements"]
+
+    if timings.enabled:
+        with st.sidebar.expander("Время по стадиям", expanded=True):
+            st.table(timings.snapshot())
+            if st.button("Сбросить замеры"):
+                timings.reset()
 
     # Кнопка для скачивания JSON
-    with open(json_file_name, "r") as f:
-        st.download_button(
-            label="Скачать результат в формате JSON",
-            data=f,
-            file_name="latest_output.json",
-            mime="application/json"
-        )
\ No newline at end of file
+    st.download_button(
+        label="Скачать результат в формате JSON",
+        data=json.dumps(output, indent=4),
+        file_name="latest_output.json",
+        mime="application/json"
+    )
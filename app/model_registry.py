@@ -0,0 +1,87 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from app_utils import load_model
+
+MAX_LOADED_MODELS = 2  # Сколько моделей держим в памяти одновременно
+
+
+def model_identity(model_path):
+    """Ключ модели в реестре: абсолютный путь + время изменения файла (для папки OpenVINO -- самого нового файла в ней)."""
+    model_path = os.path.abspath(model_path)
+    if os.path.isdir(model_path):
+        mtime = max([os.path.getmtime(os.path.join(model_path, f)) for f in os.listdir(model_path)]
+                    + [os.path.getmtime(model_path)])
+    else:
+        mtime = os.path.getmtime(model_path)
+    return model_path, mtime
+
+
+class ModelRegistry:
+    """
+    Общий для процесса реестр загруженных моделей.
+    Streamlit перезапускает main.py при каждом действии пользователя, но импортированные
+    модули живут весь процесс, поэтому модели из реестра переживают перезапуски.
+    Хранит не больше max_models моделей, при переполнении выкидывает давно не использованную (LRU).
+    Если файл модели перезаписали, меняется mtime и модель загружается заново.
+    """
+
+    def __init__(self, max_models=MAX_LOADED_MODELS):
+        self.max_models = max_models
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_time = 0.0
+
+    def get(self, model_path):
+        key = model_identity(model_path)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return self._models[key]
+
+            self.misses += 1
+            start = time.perf_counter()
+            model = load_model(key[0])
+            self.load_time += time.perf_counter() - start
+            # Неудачную загрузку не кэшируем, чтобы следующий вызов попробовал снова
+            if model is None:
+                return None
+
+            # Старые версии того же файла больше не понадобятся
+            for stale_key in [k for k in self._models if k[0] == key[0]]:
+                del self._models[stale_key]
+                self.evictions += 1
+
+            self._models[key] = model
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+                self.evictions += 1
+            return model
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "loaded": [os.path.basename(path) for path, _ in self._models],
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "load_time": round(self.load_time, 3),
+            }
+
+
+registry = ModelRegistry()
+
+
+def get_model(model_path):
+    """Возвращает модель из общего реестра, загружая её при первом обращении."""
+    return registry.get(model_path)
@@ -0,0 +1,74 @@
+import io
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from timings import timings
+
+PAGE_SIZE = (612, 792)  # Размер вертикальной страницы, на котором работает модель
+REDUCING_GAP = 3.0  # Большие сканы сначала грубо уменьшаются в целое число раз (Image.reduce), потом ресемплятся
+
+
+def page_size(width, height):
+    """Размер, к которому приводится страница: 612x792 или 792x612 для горизонтальных."""
+    if width > height:  # Горизонтальное изображение
+        return PAGE_SIZE[1], PAGE_SIZE[0]
+    return PAGE_SIZE  # Вертикальное изображение
+
+
+def _open_image(source):
+    if isinstance(source, Image.Image):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    return Image.open(source)
+
+
+def prepare_page(source):
+    """
+    Готовит страницу для модели с минимумом копий.
+    source: байты файла, путь, файловый объект, PIL Image или RGB-массив numpy.
+
+    - JPEG декодируется сразу в уменьшенном виде (Image.draft), остальные форматы
+      уменьшаются через reduce + ресемплинг (reducing_gap), а не полным ресемплингом скана 300 DPI;
+    - перевод в RGB делается после уменьшения, на маленьком изображении;
+    - PIL Image превращается в numpy без второй копии (np.asarray);
+    - BGR для модели -- это view с развёрнутыми каналами, а не cv2.cvtColor.
+
+    Возвращает (массив BGR размера 612x792 или 792x612, масштаб (sx, sy) к исходному размеру).
+    """
+    if isinstance(source, np.ndarray):
+        original_size = source.shape[1], source.shape[0]
+        size = page_size(*original_size)
+        if original_size != size:
+            with timings.stage("resize"):
+                source = cv2.resize(source, size, interpolation=cv2.INTER_AREA)
+        return source[..., ::-1], _scale(original_size, size)
+
+    with timings.stage("decode"):
+        image = _open_image(source)
+        original_size = image.size
+        size = page_size(*original_size)
+        if image is not source:
+            # Работает только для JPEG, для остальных форматов ничего не делает. Переданный снаружи PIL Image
+            # не трогаем: draft уменьшил бы картинку вызывающего кода на месте
+            image.draft("RGB", size)
+        image.load()
+    if image.size != size:
+        with timings.stage("resize"):
+            image = image.resize(size, reducing_gap=REDUCING_GAP)
+    with timings.stage("to_array"):
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        return np.asarray(image)[..., ::-1], _scale(original_size, size)
+
+
+def _scale(original_size, size):
+    return original_size[0] / size[0], original_size[1] / size[1]
+
+
+def scale_boxes(boxes, scale):
+    """Переводит боксы [x1, y1, x2, y2] из координат страницы модели в координаты исходного изображения."""
+    sx, sy = scale
+    return (boxes * np.array([sx, sy, sx, sy], dtype=np.float32)).astype(np.int32)
@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+import random
+import time
+from collections import Counter
+
+import numpy as np
+import onnx
+from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic,
+                                      quantize_static)
+from ultralytics.data.augment import LetterBox
+
+from app_utils import load_model, process_image
+from export_models import IMGSZ, export_checkpoint
+from preprocessing import prepare_page
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+IMAGES_DIR = os.path.join(BASE_DIR, "../data/images/")
+ANNOTATIONS_DIR = os.path.join(BASE_DIR, "../data/annotations/")
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+NUM_CALIBRATION = 100  # Сколько сгенерированных страниц использовать для калибровки
+NUM_EVAL = 100  # На скольких страницах сравнивать FP32 и INT8
+IOU_THRESHOLD = 0.5
+
+
+def to_model_input(image_path, imgsz=IMGSZ):
+    """Тот же тензор, что строит ultralytics перед вызовом ONNX-модели: letterbox, RGB, CHW, 0..1."""
+    image, _ = prepare_page(image_path)
+    image = LetterBox(new_shape=(imgsz, imgsz), auto=False)(image=image)
+    image = image[..., ::-1].transpose(2, 0, 1)
+    return np.ascontiguousarray(image, dtype=np.float32)[None] / 255.0
+
+
+class PageCalibrationReader(CalibrationDataReader):
+    """Подаёт в калибровку ONNX Runtime страницы из сгенерированного датасета."""
+
+    def __init__(self, image_paths, input_name, imgsz=IMGSZ):
+        self._inputs = ({input_name: to_model_input(path, imgsz)} for path in image_paths)
+
+    def get_next(self):
+        return next(self._inputs, None)
+
+
+def quantize(fp32_path, int8_path, calibration_paths, mode="static", imgsz=IMGSZ):
+    fp32_model = onnx.load(fp32_path)
+    if mode == "dynamic":
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QUInt8)
+    else:
+        input_name = fp32_model.graph.input[0].name
+        quantize_static(fp32_path, int8_path, PageCalibrationReader(calibration_paths, input_name, imgsz),
+                        quant_format=QuantFormat.QDQ, activation_type=QuantType.QUInt8,
+                        weight_type=QuantType.QInt8, per_channel=True)
+
+    # Ultralytics берёт имена классов, stride и imgsz из метаданных ONNX -- переносим их в квантованную модель
+    int8_model = onnx.load(int8_path)
+    if not int8_model.metadata_props:
+        onnx.helper.set_model_props(int8_model, {p.key: p.value for p in fp32_model.metadata_props})
+        onnx.save(int8_model, int8_path)
+
+
+def iou(box1, box2):
+    x1, y1 = max(box1[0], box2[0]), max(box1[1], box2[1])
+    x2, y2 = min(box1[2], box2[2]), min(box1[3], box2[3])
+    intersection = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (box1[2] - box1[0]) * (box1[3] - box1[1]) + (box2[2] - box2[0]) * (box2[3] - box2[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def count_found(references, predictions, found, total):
+    """Считает по классам, сколько эталонных боксов нашлось среди предсказаний того же класса."""
+    for cls, box in references:
+        total[cls] += 1
+        if any(p_cls == cls and iou(box, p_box) >= IOU_THRESHOLD for p_cls, p_box in predictions):
+            found[cls] += 1
+
+
+def as_boxes(elements):
+    return [(e["class"], (e["x1"], e["y1"], e["x2"], e["y2"])) for e in elements]
+
+
+def load_ground_truth(annotations_dir, image_file):
+    """Разметка страницы из extract_annotations.py: <pdf>_page_<n>.json для картинки <pdf>_<n>.png."""
+    stem, page_num = os.path.splitext(image_file)[0].rsplit('_', 1)
+    json_path = os.path.join(annotations_dir, f"{stem}_page_{page_num}.json")
+    if not os.path.exists(json_path):
+        return None
+    with open(json_path, encoding='utf-8') as f:
+        page_info = json.load(f)
+    return [(cls, box) for cls, boxes in page_info.items() if isinstance(boxes, list) for box in boxes]
+
+
+def evaluate(fp32_path, int8_path, image_paths, annotations_dir):
+    """
+    Полнота по классам и p50 задержки для FP32 и INT8 моделей.
+    Эталон -- разметка датасета, если она есть для страницы, иначе предсказания FP32-модели.
+    """
+    models = {"FP32": load_model(fp32_path), "INT8": load_model(int8_path)}
+    found = {name: Counter() for name in models}
+    total = {name: Counter() for name in models}
+    latencies = {name: [] for name in models}
+    uses_ground_truth = False
+
+    for image_path in image_paths:
+        predictions = {}
+        for name, model in models.items():
+            start = time.perf_counter()
+            predictions[name] = as_boxes(process_image(image_path, model, annotate=False)["elements"])
+            latencies[name].append(time.perf_counter() - start)
+
+        references = load_ground_truth(annotations_dir, os.path.basename(image_path)) if annotations_dir else None
+        uses_ground_truth = uses_ground_truth or references is not None
+        if references is None:
+            references = predictions["FP32"]
+        for name in models:
+            count_found(references, predictions[name], found[name], total[name])
+
+    # Первый вызов включает прогрев, в задержку его не берём
+    p50 = {name: float(np.median(values[1:] or values)) * 1000 for name, values in latencies.items()}
+    return found, total, p50, uses_ground_truth
+
+
+def print_report(fp32_path, int8_path, found, total, p50, uses_ground_truth):
+    reference = "разметка датасета" if uses_ground_truth else "предсказания FP32"
+    print(f"\nПолнота по классам (эталон: {reference}, IoU >= {IOU_THRESHOLD})")
+    print(f"{'класс':<20}{'объектов':>10}{'FP32':>10}{'INT8':>10}")
+    for cls in sorted(total["FP32"]):
+        recalls = [found[name][cls] / total[name][cls] for name in ("FP32", "INT8")]
+        print(f"{cls:<20}{total['FP32'][cls]:>10}{recalls[0]:>10.3f}{recalls[1]:>10.3f}")
+
+    sizes = [os.path.getsize(path) / 2 ** 20 for path in (fp32_path, int8_path)]
+    print(f"{'p50 задержка, мс':<30}{p50['FP32']:>10.1f}{p50['INT8']:>10.1f}")
+    print(f"{'размер модели, МБ':<30}{sizes[0]:>10.1f}{sizes[1]:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="INT8-квантизация моделей для CPU с отчётом о точности и скорости")
+    parser.add_argument("model", help="Модель .pt или экспортированная .onnx")
+    parser.add_argument("--mode", choices=["static", "dynamic"], default="static",
+                        help="static -- с калибровкой на страницах датасета, dynamic -- только веса")
+    parser.add_argument("--images-dir", default=IMAGES_DIR, help="Сгенерированные страницы для калибровки и оценки")
+    parser.add_argument("--annotations-dir", default=ANNOTATIONS_DIR)
+    parser.add_argument("--num-calibration", type=int, default=NUM_CALIBRATION)
+    parser.add_argument("--num-eval", type=int, default=NUM_EVAL)
+    parser.add_argument("--imgsz", type=int, default=IMGSZ)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fp32_path = args.model
+    if fp32_path.endswith('.pt'):
+        fp32_path = export_checkpoint(fp32_path, "onnx", args.imgsz)
+    # Квантованная модель кладётся рядом, в models/, и сразу появляется в списке моделей приложения
+    int8_path = os.path.splitext(fp32_path)[0] + '_int8.onnx'
+
+    image_files = sorted(f for f in os.listdir(args.images_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+    rng = random.Random(args.seed)
+    rng.shuffle(image_files)
+    image_paths = [os.path.join(args.images_dir, f) for f in image_files]
+    calibration_paths = image_paths[:args.num_calibration]
+    eval_paths = image_paths[args.num_calibration:args.num_calibration + args.num_eval] or calibration_paths
+
+    quantize(fp32_path, int8_path, calibration_paths, args.mode, args.imgsz)
+    print(f"Квантованная модель: {int8_path}")
+
+    annotations_dir = args.annotations_dir if os.path.isdir(args.annotations_dir) else None
+    print_report(fp32_path, int8_path, *evaluate(fp32_path, int8_path, eval_paths, annotations_dir))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from model_registry import model_identity
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, "../data/result_cache/")
+MAX_CACHE_MB = 512
+LOW_WATERMARK = 0.9  # После очистки кэш занимает не больше этой доли от лимита
+RESCAN_EVERY = 100  # Раз в сколько записей пересчитывать размер (его меняют и другие процессы)
+STALE_TMP_SECONDS = 3600  # Временные файлы старше этого оставлены упавшей записью и удаляются при обходе кэша
+
+
+class ResultCache:
+    """
+    Кэш результатов модели на диске с адресацией по содержимому.
+    Ключ -- хэш байтов файла, идентичность модели (путь, mtime, размер) и параметры инференса,
+    значение -- JSON с результатом. Попадание в кэш не требует ни декодирования картинки, ни модели.
+
+    Кэш можно использовать из нескольких процессов одновременно: запись идёт во временный файл
+    с атомарным переименованием, а чтение и очистка спокойно переживают удалённые соседом файлы.
+    Вытеснение -- LRU по mtime файла, который обновляется при каждом попадании.
+    Временные файлы, оставшиеся после падения процесса во время записи, удаляются при обходе кэша
+    (при создании и при вытеснении); свежие не трогаются, их может дописывать сосед.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_MB * 2 ** 20):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._size = self._scan_size()
+        self._writes_since_scan = 0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    def key(self, file_bytes, model_path, params=None):
+        path, mtime = model_identity(model_path)
+        model_size = os.path.getsize(path) if os.path.isfile(path) else 0
+        digest = hashlib.sha256()
+        digest.update(hashlib.sha256(file_bytes).digest())
+        digest.update(json.dumps([path, mtime, model_size, params or {}], sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)  # Отмечаем использование для LRU
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with self._lock:
+            self.writes += 1
+            self._size += len(data)
+            self._writes_since_scan += 1
+            need_scan = self._writes_since_scan >= RESCAN_EVERY
+        if need_scan or self._size > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        entries = []
+        stale_before = time.time() - STALE_TMP_SECONDS
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if not entry.name.endswith((".json", ".tmp")):
+                    continue
+                try:
+                    stat = entry.stat()
+                    if entry.name.endswith(".tmp"):
+                        if stat.st_mtime < stale_before:
+                            os.remove(entry.path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Пересчитывает размер кэша и удаляет давно не использованные записи, если лимит превышен."""
+        entries = self._entries()
+        size = sum(entry_size for _, entry_size, _ in entries)
+        evicted = 0
+        if size > self.max_bytes:
+            for _, entry_size, path in sorted(entries):
+                if size <= self.max_bytes * LOW_WATERMARK:
+                    break
+                try:
+                    os.remove(path)
+                    evicted += 1
+                except FileNotFoundError:
+                    pass  # Уже удалил другой процесс
+                size -= entry_size
+        with self._lock:
+            self._size = size
+            self._writes_since_scan = 0
+            self.evictions += evicted
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / requests, 3) if requests else None,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "size_mb": round(self._size / 2 ** 20, 2),
+                "max_mb": round(self.max_bytes / 2 ** 20, 2),
+            }
+
+
+_default_cache = None
+
+
+def get_result_cache():
+    """Общий для процесса кэш в CACHE_DIR (создаётся при первом обращении)."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResultCache()
+    return _default_cache
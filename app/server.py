@@ -0,0 +1,272 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from app_utils import columnar_to_elements, iter_pdf_pages, list_model_files, prepare_image, process_batch
+from model_registry import get_model
+from result_cache import MAX_CACHE_MB, ResultCache
+from timings import timings
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# В контейнере модели не входят в образ: папка монтируется и задаётся переменной MODELS_DIR
+MODELS_DIR = os.environ.get("MODELS_DIR", os.path.join(BASE_DIR, "../models/"))
+
+MAX_BATCH_SIZE = 8  # Максимальный размер пачки на один вызов модели
+MAX_WAIT_MS = 10  # Сколько ждать остальные запросы, прежде чем запускать неполную пачку
+LATENCY_WINDOW = 10000  # По скольким последним запросам считать перцентили
+
+
+class ServiceStats:
+    """Задержки запросов и гистограмма размеров пачек."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.batch_sizes = Counter()
+        self.requests = 0
+        self.errors = 0
+
+    def record_request(self, latency, ok=True):
+        with self._lock:
+            self.requests += 1
+            if ok:
+                self.latencies.append(latency)
+            else:
+                self.errors += 1
+
+    def record_batch(self, size):
+        with self._lock:
+            self.batch_sizes[size] += 1
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "latency_ms": {
+                    "p50": percentile(latencies, 0.50),
+                    "p95": percentile(latencies, 0.95),
+                },
+                "batch_size_histogram": {str(size): count for size, count in sorted(self.batch_sizes.items())},
+            }
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return round(sorted_values[index] * 1000, 2)
+
+
+class MicroBatcher:
+    """
+    Собирает страницы из параллельных запросов в общие пачки.
+    Пачка уходит в модель, когда набралось max_batch_size страниц или с момента
+    прихода первой страницы прошло max_wait_ms. Модель вызывается только из одного
+    потока, поэтому одновременные клиенты делят проходы модели, а не стоят в очереди к ней.
+    """
+
+    def __init__(self, model, stats, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.model = model
+        self.stats = stats
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, images):
+        """Ставит подготовленные (prepare_image) страницы в очередь и возвращает по Future на каждую."""
+        futures = []
+        for image in images:
+            future = Future()
+            self._queue.put((image, future))
+            futures.append(future)
+        return futures
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            self.stats.record_batch(len(batch))
+            try:
+                outputs = process_batch([image for image, _ in batch], self.model, output_format="columnar")
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), output in zip(batch, outputs):
+                future.set_result(output["columnar"])
+
+
+class DetectionHandler(BaseHTTPRequestHandler):
+    """
+    POST /detect  -- тело запроса: PNG/JPEG страницы или PDF, ответ: JSON с элементами
+                     (?format=columnar -- компактный колоночный формат)
+    GET /metrics  -- перцентили задержки, гистограмма размеров пачек, статистика кэша и время по стадиям
+                     (?format=prometheus -- время по стадиям в текстовом формате Prometheus)
+    GET /health   -- проверка, что сервис жив
+    """
+    batcher = None
+    stats = None
+    cache = None  # ResultCache или None, если кэш выключен
+    model_path = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif url.path == "/metrics":
+            if parse_qs(url.query).get("format", ["json"])[0] == "prometheus":
+                self._send_text(200, timings.to_prometheus())
+                return
+            metrics = self.stats.snapshot()
+            if self.cache is not None:
+                metrics["cache"] = self.cache.stats()
+            if timings.enabled:
+                metrics["stages"] = timings.snapshot()
+            self._send_json(200, metrics)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/detect":
+            self._send_json(404, {"error": "not found"})
+            return
+        output_format = parse_qs(url.query).get("format", ["elements"])[0]
+
+        start = time.perf_counter()
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        is_pdf = body.startswith(b"%PDF-")
+
+        cache_key = None
+        columnar = None
+        if self.cache is not None:
+            # При попадании в кэш файл даже не декодируется
+            cache_key = self.cache.key(body, self.model_path, {"source": "pdf" if is_pdf else "image"})
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                columnar = cached if is_pdf else [cached]
+
+        if columnar is None:
+            try:
+                # Декодирование идёт в потоке запроса, параллельно с другими запросами;
+                # поток модели получает уже готовые страницы
+                if is_pdf:
+                    pages = [prepare_image(page) for page in iter_pdf_pages(body)]
+                else:
+                    pages = [prepare_image(body)]
+            except Exception as e:
+                self.stats.record_request(time.perf_counter() - start, ok=False)
+                self._send_json(400, {"error": f"Не удалось прочитать файл: {e}"})
+                return
+
+            try:
+                columnar = [future.result() for future in self.batcher.submit(pages)]
+            except Exception as e:
+                self.stats.record_request(time.perf_counter() - start, ok=False)
+                self._send_json(500, {"error": f"Ошибка обработки: {e}"})
+                return
+
+            if cache_key is not None:
+                try:
+                    self.cache.put(cache_key, columnar if is_pdf else columnar[0])
+                except OSError as e:  # Кэш -- только ускорение, ошибка записи не должна ронять ответ
+                    print(f"Не удалось записать результат в кэш: {e}")
+
+        if output_format == "columnar":
+            key, pages_output = "columnar", columnar
+        else:
+            key, pages_output = "elements", [columnar_to_elements(page) for page in columnar]
+        if is_pdf:
+            response = {"pages": [{"page": page_num, key: page_output}
+                                  for page_num, page_output in enumerate(pages_output, start=1)]}
+        else:
+            response = {key: pages_output[0]}
+        self.stats.record_request(time.perf_counter() - start)
+        self._send_json(200, response)
+
+    def _send_json(self, status, payload):
+        with timings.stage("serialize"):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self._send(status, data, "application/json; charset=utf-8")
+
+    def _send_text(self, status, text):
+        self._send(status, text.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+
+    def _send(self, status, data, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def default_model_path():
+    model_files = list_model_files(MODELS_DIR) if os.path.isdir(MODELS_DIR) else []
+    if not model_files:
+        raise SystemExit(f"В {MODELS_DIR} нет моделей: укажите --model или папку с моделями в переменной MODELS_DIR")
+    return os.path.join(MODELS_DIR, model_files[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP-сервис определения элементов документа")
+    parser.add_argument("--model", default=None, help="Путь к модели (по умолчанию первая модель из MODELS_DIR, иначе из models/)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch-size", type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS)
+    parser.add_argument("--cache-dir", default=None, help="Папка кэша результатов (по умолчанию кэш выключен)")
+    parser.add_argument("--cache-max-mb", type=float, default=MAX_CACHE_MB)
+    parser.add_argument("--timings", action="store_true", help="Замерять время по стадиям обработки (см. /metrics)")
+    args = parser.parse_args()
+    timings.enabled = args.timings
+
+    model_path = args.model or default_model_path()
+    model = get_model(model_path)
+    if model is None:
+        raise SystemExit("Не удалось загрузить модель")
+
+    stats = ServiceStats()
+    DetectionHandler.stats = stats
+    DetectionHandler.model_path = model_path
+    if args.cache_dir:
+        DetectionHandler.cache = ResultCache(args.cache_dir, int(args.cache_max_mb * 2 ** 20))
+    DetectionHandler.batcher = MicroBatcher(model, stats, args.max_batch_size, args.max_wait_ms)
+
+    server = ThreadingHTTPServer((args.host, args.port), DetectionHandler)
+    print(f"Сервис запущен на http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
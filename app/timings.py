@@ -0,0 +1,88 @@
+import threading
+import time
+
+
+class _NullTimer:
+    """Заглушка, которую отдаёт выключенный замер: вход и выход ничего не делают."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _StageTimer:
+    __slots__ = ("_timings", "_name", "_start")
+
+    def __init__(self, timings, name):
+        self._timings = timings
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._timings.record(self._name, time.perf_counter() - self._start)
+        return False
+
+
+class StageTimings:
+    """
+    Замер времени по стадиям пути обработки страницы (декодирование, ресайз, модель, разметка...).
+    По умолчанию выключен: stage() возвращает общую заглушку, поэтому цена выключенного замера --
+    одна проверка флага и пустой with.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {}  # стадия -> [количество, суммарное время, максимум]
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self, name)
+
+    def record(self, name, seconds):
+        with self._lock:
+            stats = self._stats.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {name: {
+                "count": count,
+                "total_s": round(total, 4),
+                "mean_ms": round(total / count * 1000, 3),
+                "max_ms": round(maximum * 1000, 3),
+            } for name, (count, total, maximum) in self._stats.items()}
+
+    def to_prometheus(self, prefix="document_detector"):
+        """Метрики в текстовом формате Prometheus."""
+        with self._lock:
+            stats = sorted(self._stats.items())
+        lines = [
+            f"# HELP {prefix}_stage_seconds_total Суммарное время стадии обработки",
+            f"# TYPE {prefix}_stage_seconds_total counter",
+        ]
+        lines += [f'{prefix}_stage_seconds_total{{stage="{name}"}} {total:.6f}' for name, (_, total, _) in stats]
+        lines += [
+            f"# HELP {prefix}_stage_calls_total Количество вызовов стадии обработки",
+            f"# TYPE {prefix}_stage_calls_total counter",
+        ]
+        lines += [f'{prefix}_stage_calls_total{{stage="{name}"}} {count}' for name, (count, _, _) in stats]
+        return "\n".join(lines) + "\n"
+
+
+timings = StageTimings()  # Общий для процесса замер, включается через timings.enabled = True
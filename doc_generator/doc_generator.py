@@ -2,19 +2,26 @@ import textwrap
 
 from docx.enum.section import WD_ORIENT, WD_SECTION
 from docx.enum.table import WD_TABLE_ALIGNMENT
-from docx.oxml import OxmlElement
+from docx.oxml import OxmlElement, parse_xml
 from docx.oxml.ns import qn
 from docx.shared import RGBColor
 from mimesis import Text
 from docx.enum.style import WD_STYLE_TYPE
-import math2docx
+import latex2mathml.converter
+import mathml2omml
 from docx import Document
 from docx.shared import Inches, Pt
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 import matplotlib.pyplot as plt
+import numpy as np
+import hashlib
 import io
+import json
+import os
 import random
+import zipfile
 from faker import Faker
+from lxml import etree
 import pandas as pd
 
 
@@ -22,10 +29,18 @@ from mimesis import Generic
 from mimesis.locales import Locale
 from mimesis.random import Random
 
-# Faker будем использовать и для английского и для русского, т.к. в примере документа оба языка
-fake = Faker(['en_US', 'ru_RU'])
-text_mimesis = Text('ru')
+LATEX_CSV = 'doc_generator/latex_for_formulas.csv'
+OMML_CACHE = 'doc_generator/formulas_omml.json'  # Собирается scripts/build_formula_cache.py
+OMML_WRAPPER = '<p xmlns:m="http://schemas.openxmlformats.org/officeDocument/2006/math">{}</p>'
+CALTECH_DIR = 'doc_generator/Caltech101/'  # Картинки 1.jpg .. CALTECH_COUNT.jpg
+CALTECH_COUNT = 9142
+PLOTQA_DIR = 'doc_generator/PlotQA/'  # Графики 0.png .. (PLOTQA_COUNT - 1).png
+PLOTQA_COUNT = 33657
+CHART_BANK_DIR = 'doc_generator/chart_bank/'  # Собирается scripts/build_chart_bank.py
+TEXT_BANK = 'doc_generator/text_bank.json'  # Собирается scripts/build_text_bank.py
+CHART_REUSE = 0.9  # Доля графиков, которые берутся из банка (если он собран), остальные рисуются заново
 NUM_ITERATIONS = 5  # Количество итераций для генерации содержимого
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)  # Фиксированное время файлов внутри docx, чтобы документ не зависел от момента сохранения
 
 COLORS = """000000 000080 00008B 0000CD 0000FF 006400 008000 008080 008B8B 00BFFF 00CED1 
 00FA9A 00FF00 00FF7F 00FFFF 191970 1E90FF 20B2AA 228B22 2E8B57 2F4F4F 32CD32 
@@ -42,6 +57,197 @@ FFD700 FFDAB9 FFDEAD FFE4B5 FFE4C4 FFE4E1 FFEBCD FFEFD5 FFF0F5 FFF5EE FFF8DC
 FFFACD FFFAF0 FFFAFA FFFF00 FFFFE0 FFFFF0 FFFFFF"""
 
 
+def document_seed(base_seed, index):
+    """Сид документа с номером index: зависит только от базового сида и номера, а не от порядка генерации."""
+    digest = hashlib.sha256(f"{base_seed}:{index}".encode()).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def formula_key(latex):
+    return hashlib.sha256(latex.encode('utf-8')).hexdigest()
+
+
+def convert_formula(latex):
+    """LaTeX -> OMML так же, как math2docx.add_math. Возвращает None, если формула не конвертируется."""
+    try:
+        return mathml2omml.convert(latex2mathml.converter.convert(latex))
+    except Exception:
+        return None
+
+
+def load_omml_cache(path=OMML_CACHE):
+    """Заранее сконвертированные формулы: хэш LaTeX -> OMML (None для формул, которые не конвертируются)."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def list_assets(directory):
+    return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+
+class LiveText:
+    """Источник текста для элементов документа: генерирует текст на лету через Faker и mimesis."""
+
+    def __init__(self, fake, text_mimesis, generic):
+        self._fake = fake
+        self._text_mimesis = text_mimesis
+        self._generic = generic
+
+    def sentence(self, nb_words):
+        return self._fake.sentence(nb_words=nb_words)
+
+    def text(self, max_nb_chars):
+        return self._fake.text(max_nb_chars=max_nb_chars)
+
+    def word(self):
+        return self._fake.word()
+
+    def mimesis_text(self, quantity):
+        return self._text_mimesis.text(quantity=quantity)
+
+    def words(self, quantity):
+        return self._generic.text.words(quantity=quantity)
+
+    def reseed(self, seed):
+        pass  # Провайдеры пересеиваются в GeneratorContext.reseed
+
+
+class BankText:
+    """
+    Источник текста из заранее сгенерированного банка (scripts/build_text_bank.py).
+    Предложения и тексты Faker хранятся по длине, которую запрашивает генератор, поэтому распределение
+    длин то же, что и при генерации на лету. Выбор -- индексами numpy, без вызовов Faker и mimesis.
+    """
+
+    def __init__(self, bank):
+        self._sentences = {int(n): np.array(pool, dtype=object) for n, pool in bank['sentences'].items()}
+        self._texts = {int(n): np.array(pool, dtype=object) for n, pool in bank['texts'].items()}
+        self._text_lengths = np.array(sorted(self._texts))
+        self._fake_words = np.array(bank['fake_words'], dtype=object)
+        self._mimesis_sentences = np.array(bank['mimesis_sentences'], dtype=object)
+        self._words = np.array(bank['words'], dtype=object)
+        self._rng = np.random.default_rng()
+
+    def _pick(self, pool, size=None):
+        return pool[self._rng.integers(len(pool), size=size)]
+
+    def sentence(self, nb_words):
+        return self._pick(self._sentences[nb_words])
+
+    def text(self, max_nb_chars):
+        # Тексты хранятся с шагом по длине, берётся ближайшая
+        nearest = self._text_lengths[np.abs(self._text_lengths - max_nb_chars).argmin()]
+        return self._pick(self._texts[int(nearest)])
+
+    def word(self):
+        return self._pick(self._fake_words)
+
+    def mimesis_text(self, quantity):
+        return ' '.join(self._pick(self._mimesis_sentences, quantity))
+
+    def words(self, quantity):
+        return list(self._pick(self._words, quantity))
+
+    def reseed(self, seed):
+        self._rng = np.random.default_rng(seed)
+
+
+def load_text_bank(path=TEXT_BANK):
+    with open(path, encoding='utf-8') as f:
+        return BankText(json.load(f))
+
+
+def load_chart_bank(directory=CHART_BANK_DIR):
+    """PNG-графики из банка, загруженные в память (размер банка ограничен при сборке)."""
+    bank = []
+    for name in list_assets(directory):
+        if name.endswith('.png'):
+            with open(os.path.join(directory, name), 'rb') as f:
+                bank.append(f.read())
+    return bank
+
+
+class GeneratorContext:
+    """
+    Тяжёлые ресурсы генератора: таблица формул, банки графиков и текста, провайдеры Faker/mimesis.
+    Создаётся один раз на процесс (get_context) и передаётся в функции элементов,
+    поэтому на каждый документ не приходится ни чтения файлов, ни создания провайдеров.
+    """
+
+    def __init__(self, latex_csv=LATEX_CSV, omml_cache=OMML_CACHE, chart_bank_dir=CHART_BANK_DIR,
+                 chart_reuse=CHART_REUSE, text_bank=None):
+        self.latex_data = pd.read_csv(latex_csv, index_col=False)['formula'].tolist()
+        self.omml_cache = load_omml_cache(omml_cache)
+        self.chart_reuse = chart_reuse
+        self.chart_bank = load_chart_bank(chart_bank_dir) if chart_reuse > 0 else []
+        # Faker будем использовать и для английского и для русского, т.к. в примере документа оба языка
+        self.fake = Faker(['en_US', 'ru_RU'])
+        self.text_mimesis = Text('ru')
+        self.generic = Generic(locale=Locale.RU)
+        self.random = Random()
+        # Текст элементов: из банка, если он передан (text_bank -- путь к нему), иначе на лету
+        self.text = load_text_bank(text_bank) if text_bank else LiveText(self.fake, self.text_mimesis, self.generic)
+        # Шаблон пустого документа python-docx читается с диска один раз, дальше документы открываются из памяти
+        template = io.BytesIO()
+        Document().save(template)
+        self.template = template.getvalue()
+
+    def formula_omml(self, latex):
+        """OMML формулы из кэша; формулы, которых нет в кэше, конвертируются один раз и запоминаются."""
+        key = formula_key(latex)
+        if key not in self.omml_cache:
+            self.omml_cache[key] = convert_formula(latex)
+        return self.omml_cache[key]
+
+    def chart_png(self):
+        """PNG графика: с вероятностью chart_reuse из банка, иначе новый график через matplotlib."""
+        if self.chart_bank and random.random() < self.chart_reuse:
+            return random.choice(self.chart_bank)
+        return render_chart(self)
+
+    def reseed(self, seed):
+        """Сбрасывает состояние всех генераторов случайности (random, Faker, mimesis) под документ."""
+        random.seed(seed)
+        Faker.seed(seed)
+        self.fake.seed_instance(seed)
+        self.text_mimesis.reseed(seed)
+        self.generic.reseed(seed)
+        self.random.seed(seed)
+        self.text.reseed(seed)
+
+
+_context = None
+
+
+def get_context(**options):
+    """
+    Общий для процесса контекст генератора (создаётся при первом обращении).
+    options -- параметры GeneratorContext, учитываются только при создании.
+    """
+    global _context
+    if _context is None:
+        _context = GeneratorContext(**options)
+    return _context
+
+
+def save_document(document, path):
+    """
+    Сохраняет docx с фиксированным временем файлов в zip-архиве:
+    при одинаковом сиде получаются побайтно одинаковые документы.
+    """
+    buffer = io.BytesIO()
+    document.save(buffer)
+    buffer.seek(0)
+    with zipfile.ZipFile(buffer) as source, zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as target:
+        for item in source.infolist():
+            info = zipfile.ZipInfo(item.filename, date_time=ZIP_DATE_TIME)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = item.external_attr
+            target.writestr(info, source.read(item.filename))
+
+
 def change_orientation(document, make_vertical):
     """ Функция смены ориентации листа"""
     section = document.sections[-1]
@@ -57,10 +263,10 @@ def change_orientation(document, make_vertical):
         section.page_width, section.page_height = section.page_height, section.page_width
 
 
-def add_header(document, base_font_size):
+def add_header(document, base_font_size, ctx):
     section = document.sections[-1]
     header = section.header
-    header_text = fake.sentence(nb_words=5)
+    header_text = ctx.text.sentence(nb_words=5)
 
     header_paragraph = header.paragraphs[0]
     header_paragraph.text = header_text
@@ -69,10 +275,10 @@ def add_header(document, base_font_size):
     run.font.size = Pt(base_font_size - 4)
 
 
-def add_footer(document, base_font_size):
+def add_footer(document, base_font_size, ctx):
     section = document.sections[-1]
     footer = section.footer
-    footer_text = fake.sentence(nb_words=5)
+    footer_text = ctx.text.sentence(nb_words=5)
 
     footer_paragraph = footer.paragraphs[0]
     footer_paragraph.text = footer_text
@@ -97,7 +303,7 @@ class RandomHeadingFormat:
             self.italic = random.choice([True, False])
 
 
-def add_heading(document, random_heading_format):
+def add_heading(document, random_heading_format, ctx):
     """
     Функция с добавлением заголовка
     """
@@ -110,7 +316,7 @@ def add_heading(document, random_heading_format):
     else:
         font_size = random_heading_format.font_size_3
 
-    heading_text = fake.sentence(nb_words=random.randint(3, 7))  # Рандомная генерация фейкером / мимезисом
+    heading_text = ctx.text.sentence(nb_words=random.randint(3, 7))  # Рандомная генерация фейкером / мимезисом
     heading = document.add_heading(level=level)
 
     # Добавление нумерации заголовка с вероятностью 50%
@@ -145,7 +351,7 @@ class RandomParagraphFormat:
         self.line_spacing = random.uniform(1.0, 1.4)
 
 
-def add_paragraph(document, random_paragraph_format):
+def add_paragraph(document, random_paragraph_format, ctx):
     """ Функция генерации обычного текста """
     # Генерация абзаца
     paragraph = document.add_paragraph()
@@ -162,25 +368,24 @@ def add_paragraph(document, random_paragraph_format):
 
     # с этой вероятностью текст будет очень большой
     if random.random() < 0.005:
-        text = fake.text(max_nb_chars=random.randint(2000, 4000))
+        text = ctx.text.text(max_nb_chars=random.randint(2000, 4000))
     else:
         # Генерация текста для абзаца
         if random.choice([True, False]):
-            text = fake.text(max_nb_chars=random.randint(400, 1000))
+            text = ctx.text.text(max_nb_chars=random.randint(400, 1000))
         else:
-            text = text_mimesis.text(quantity=random.randint(5, 15))
+            text = ctx.text.mimesis_text(quantity=random.randint(5, 15))
 
     run = paragraph.add_run(text)
     run.font.size = Pt(random_paragraph_format.font_size)
     run.font.name = random_paragraph_format.font_name
 
 
-def get_table(doc, base_font_size):
-    random = Random()
-    generic = Generic(locale=Locale.RU)
+def get_table(doc, base_font_size, ctx):
+    random = ctx.random
 
     below_above = random.randint(0, 1)
-    caption_text = fake.sentence(nb_words=random.randint(3, 7))
+    caption_text = ctx.text.sentence(nb_words=random.randint(3, 7))
     if random.choice([True, False]):
         caption_text = f"Табл. {random.randint(1, 100)} - {caption_text}"
     elif random.choice([True, False]):
@@ -221,7 +426,7 @@ def get_table(doc, base_font_size):
     for row in range(rows):
         row_cells = table.add_row().cells
         for col in range(cols):
-            row_cells[col].text = ' '.join(generic.text.words(quantity=random.randint(a=1, b=3)))
+            row_cells[col].text = ' '.join(ctx.text.words(quantity=random.randint(a=1, b=3)))
 
     if below_above == 0:
         paragraph = doc.add_paragraph(caption_text)
@@ -230,7 +435,8 @@ def get_table(doc, base_font_size):
         run.font.size = Pt(base_font_size)
 
 
-def generate_plot_or_chart():
+def generate_plot_or_chart(ctx):
+    text = ctx.text
     chart_type = random.choice(['line', 'bar', 'scatter', 'pie'])
     fig, ax = plt.subplots()
     if chart_type == 'line':
@@ -238,42 +444,47 @@ def generate_plot_or_chart():
         y = [random.randint(1, 100) for _ in x]
         ax.plot(x, y, color=random.choice(['red', 'green', 'blue']), linestyle=random.choice(['-', '--', '-.', ':']),
                 linewidth=random.uniform(0.5, 2.5))
-        ax.set_title(fake.sentence(nb_words=random.randint(1, 4)))
-        ax.set_xlabel(fake.word())
-        ax.set_ylabel(fake.word())
+        ax.set_title(text.sentence(nb_words=random.randint(1, 4)))
+        ax.set_xlabel(text.word())
+        ax.set_ylabel(text.word())
 
     elif chart_type == 'bar':
         x = range(5)
         y = [random.randint(1, 100) for _ in x]
         ax.bar(x, y, color=random.choice(['red', 'green', 'blue']))
-        ax.set_title(fake.sentence(nb_words=random.randint(1, 4)))
-        ax.set_xlabel(fake.word())
-        ax.set_ylabel(fake.word())
+        ax.set_title(text.sentence(nb_words=random.randint(1, 4)))
+        ax.set_xlabel(text.word())
+        ax.set_ylabel(text.word())
 
     elif chart_type == 'scatter':
         x = [random.uniform(0, 100) for _ in range(20)]
         y = [random.uniform(0, 100) for _ in range(20)]
         ax.scatter(x, y, color=random.choice(['red', 'green', 'blue']), s=random.randint(10, 200))
-        ax.set_title(fake.sentence(nb_words=random.randint(1, 4)))
-        ax.set_xlabel(fake.word())
-        ax.set_ylabel(fake.word())
+        ax.set_title(text.sentence(nb_words=random.randint(1, 4)))
+        ax.set_xlabel(text.word())
+        ax.set_ylabel(text.word())
 
     elif chart_type == 'pie':
         sizes = [random.randint(1, 10) for _ in range(4)]
-        labels = [fake.word(), fake.word(), fake.word(), fake.word()]
+        labels = [text.word(), text.word(), text.word(), text.word()]
         colors = ['red', 'green', 'blue', 'yellow']
         ax.pie(sizes, labels=labels, colors=colors, autopct='%1.1f%%', startangle=140)
-        ax.set_title(fake.sentence(nb_words=random.randint(1, 4)))
+        ax.set_title(text.sentence(nb_words=random.randint(1, 4)))
 
 
-def add_picture_with_caption(document, base_font_size):
-    """ Функция добавления картинки вместе с подписью сразу """
-    # Создание графика (будет вместо рисунков)
-    generate_plot_or_chart()
+def render_chart(ctx):
+    """Рисует случайный график и возвращает его в виде PNG."""
+    generate_plot_or_chart(ctx)
     img_stream = io.BytesIO()
     plt.savefig(img_stream, format='PNG')
     plt.close()
-    img_stream.seek(0)
+    return img_stream.getvalue()
+
+
+def add_picture_with_caption(document, base_font_size, ctx):
+    """ Функция добавления картинки вместе с подписью сразу """
+    # График (будет вместо рисунков): из банка готовых графиков или нарисованный заново
+    img_stream = io.BytesIO(ctx.chart_png())
 
     # Определяем выравнивание
     alignment = random.choices(['left', 'center', 'right'], weights=[30, 70, 30])[0]
@@ -302,10 +513,10 @@ def add_picture_with_caption(document, base_font_size):
     picture_number = random.randint(1, 100)
     limiter = random.randint(40, 60)
     if random.random() < 0.01:
-        caption_text = f"{caption_prefix} {picture_number}. {fake.sentence(nb_words=random.randint(15, 50))}"
+        caption_text = f"{caption_prefix} {picture_number}. {ctx.text.sentence(nb_words=random.randint(15, 50))}"
         caption_text = '\n'.join(textwrap.wrap(caption_text, limiter))
     else:
-        caption_text = f"{caption_prefix} {picture_number}. {fake.sentence(nb_words=random.randint(2, 7))}"
+        caption_text = f"{caption_prefix} {picture_number}. {ctx.text.sentence(nb_words=random.randint(2, 7))}"
         caption_text = '\n'.join(textwrap.wrap(caption_text, limiter))
 
     # Создаем подпись в новом параграфе
@@ -327,22 +538,30 @@ def add_picture_with_caption(document, base_font_size):
     document.add_paragraph()  # Добавляем пустой параграф для отделения
 
 
-def get_formula(doc, latex_data):
+def get_formula(doc, ctx):
     """ Вызвать функцию == добавить формулу в документ"""
-    paragraph = doc.add_paragraph()
-    latex_ = r'{}'.format(latex_data[random.randint(a=0, b=2371)])
+    latex_ = r'{}'.format(random.choice(ctx.latex_data))
+    omml = ctx.formula_omml(latex_)
+    if omml is None:  # Формула не конвертируется в OMML -- пропускаем её, а не роняем документ
+        return
+
+    try:
+        math = parse_xml(OMML_WRAPPER.format(omml))[0]
+    except (etree.XMLSyntaxError, ValueError):  # Битая запись в кэше -- тоже пропускаем формулу
+        return
 
-    math2docx.add_math(paragraph, latex_)
+    paragraph = doc.add_paragraph()
+    paragraph._p.append(math)
 
 
-def add_numbered_list(document, random_paragraph_format):
+def add_numbered_list(document, random_paragraph_format, ctx):
     """ Вызвать функцию == добавить нумерованный список в документ"""
     list_type = 'List Number'
     num_items = random.randint(3, 7)
     paragraph = None
     for _ in range(num_items):
-        list_item = fake.sentence(nb_words=random.randint(3, 15)) if random.choice([True, False]) else \
-            text_mimesis.text(quantity=1).split('.')[0]
+        list_item = ctx.text.sentence(nb_words=random.randint(3, 15)) if random.choice([True, False]) else \
+            ctx.text.mimesis_text(quantity=1).split('.')[0]
         paragraph = document.add_paragraph(style=list_type)
         run = paragraph.add_run(list_item)
         run.font.size = Pt(random_paragraph_format.font_size)
@@ -355,14 +574,14 @@ def add_numbered_list(document, random_paragraph_format):
     paragraph.paragraph_format.space_after = Pt(5)
 
 
-def add_bulleted_list(document, random_paragraph_format):
+def add_bulleted_list(document, random_paragraph_format, ctx):
     """ Вызвать функцию == добавить маркированный список в документ"""
     list_type = 'List Bullet'
     num_items = random.randint(3, 7)
     paragraph = None
     for _ in range(num_items):
-        list_item = fake.sentence(nb_words=random.randint(3, 15)) if random.choice([True, False]) else \
-            text_mimesis.text(quantity=1).split('.')[0]
+        list_item = ctx.text.sentence(nb_words=random.randint(3, 15)) if random.choice([True, False]) else \
+            ctx.text.mimesis_text(quantity=1).split('.')[0]
         paragraph = document.add_paragraph(style=list_type)
         run = paragraph.add_run(list_item)
         run.font.size = Pt(random_paragraph_format.font_size)
@@ -375,13 +594,13 @@ def add_bulleted_list(document, random_paragraph_format):
     paragraph.paragraph_format.space_after = Pt(5)
 
 
-def add_footnotes_section(document, random_paragraph_format):
+def add_footnotes_section(document, random_paragraph_format, ctx):
     document.add_paragraph()
     for fn_count in range(random.randint(1, 10)):
         fn_paragraph = document.add_paragraph()
         index_run = fn_paragraph.add_run(f'[{fn_count}] ')
         index_run.bold = True
-        fn_paragraph.add_run(fake.sentence(nb_words=random.randint(3, 15)))
+        fn_paragraph.add_run(ctx.text.sentence(nb_words=random.randint(3, 15)))
         fn_paragraph.runs[0].font.size = Pt(random_paragraph_format.font_size)
         fn_paragraph.runs[0].font.name = random_paragraph_format.font_name
         fn_paragraph.runs[1].font.size = Pt(random_paragraph_format.font_size)
@@ -394,9 +613,8 @@ def add_footnotes_section(document, random_paragraph_format):
         fn_paragraph.paragraph_format.line_spacing = random_paragraph_format.line_spacing - 0.2
 
 
-def add_multicolumn_text(doc, based_font_size):
-    generic = Generic(locale=Locale.RU)
-    random = Random()
+def add_multicolumn_text(doc, based_font_size, ctx):
+    random = ctx.random
 
     colums = random.weighted_choice({'2': 0.5, '3': 0.5})
     if colums == '2':
@@ -406,10 +624,10 @@ def add_multicolumn_text(doc, based_font_size):
         right_cell = table.cell(0, 1)
 
         quantity = random.randint(a=30, b=60)
-        left_cell.text = ' '.join(generic.text.words(quantity=quantity))
+        left_cell.text = ' '.join(ctx.text.words(quantity=quantity))
         left_cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.LEFT
         left_cell.paragraphs[0].runs[0].font.size = Pt(based_font_size)
-        right_cell.text = ' '.join(generic.text.words(quantity=quantity))
+        right_cell.text = ' '.join(ctx.text.words(quantity=quantity))
         right_cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.LEFT
         right_cell.paragraphs[0].runs[0].font.size = Pt(based_font_size)
 
@@ -421,20 +639,19 @@ def add_multicolumn_text(doc, based_font_size):
         right_cell = table.cell(0, 2)
 
         quantity = random.randint(a=20, b=40)
-        left_cell.text = ' '.join(generic.text.words(quantity=quantity))
+        left_cell.text = ' '.join(ctx.text.words(quantity=quantity))
         left_cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.LEFT
         left_cell.paragraphs[0].runs[0].font.size = Pt(based_font_size)
-        right_cell.text = ' '.join(generic.text.words(quantity=quantity))
+        right_cell.text = ' '.join(ctx.text.words(quantity=quantity))
         right_cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.LEFT
         right_cell.paragraphs[0].runs[0].font.size = Pt(based_font_size)
-        center_cell.text = ' '.join(generic.text.words(quantity=quantity))
+        center_cell.text = ' '.join(ctx.text.words(quantity=quantity))
         center_cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.LEFT
         center_cell.paragraphs[0].runs[0].font.size = Pt(based_font_size)
 
 
-def get_footnote(doc, based_font_size):
-    generic = Generic(locale=Locale.RU)
-    random = Random()
+def get_footnote(doc, based_font_size, ctx):
+    random = ctx.random
 
     section = doc.sections[0]
     paragraph = section.footer.paragraphs[0]
@@ -443,8 +660,8 @@ def get_footnote(doc, based_font_size):
     paragraph.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.LEFT
     power_utf8 = {1: '\u00B9', 2: '\u00B2', 3: '\u00B3', 4: '\u2074'}
     for note in range(1, random.randint(a=2, b=5)):
-        random_word = generic.text.words(quantity=1)
-        random_sentence = generic.text.words(quantity=random.randint(a=3, b=6))
+        random_word = ctx.text.words(quantity=1)
+        random_sentence = ctx.text.words(quantity=random.randint(a=3, b=6))
         if random.choice([True, False]):
             footnote_text = f"{power_utf8[note]}{random_word[0]} — {' '.join(random_sentence)} \n"
         else:
@@ -452,40 +669,44 @@ def get_footnote(doc, based_font_size):
         paragraph.add_run(footnote_text).italic = True
 
 
-def get_image(doc, based_font_size, num_of_pictures):
-    random = Random()
-    generic = Generic(locale=Locale.RU)
+def get_image(doc, based_font_size, num_of_pictures, ctx):
+    random = ctx.random
 
     image_note = random.randint(a=0, b=1)
     if image_note == 0:
         paragraph = doc.add_paragraph()
         run = paragraph.add_run(str('Рисунок ' + str(num_of_pictures) + ' — ' + ' '.join(
-            generic.text.words(quantity=random.randint(a=1, b=3)))))
+            ctx.text.words(quantity=random.randint(a=1, b=3)))))
         run.font.size = Pt(based_font_size)
         num_of_pictures += 1
+    # Файлы пронумерованы, поэтому путь строится по номеру, без обхода папок
     if random.weighted_choice({0: 0.5, 1: 0.5}) > 0:
-        doc.add_picture(
-            'doc_generator/Caltech101/' + str(random.randint(a=1, b=9142)) + '.jpg',
-            width=Inches(random.choice_enum_item((3.5, 4, 4.5))))
+        doc.add_picture(os.path.join(CALTECH_DIR, f'{random.randint(a=1, b=CALTECH_COUNT)}.jpg'),
+                        width=Inches(random.choice_enum_item((3.5, 4, 4.5))))
     else:
-        doc.add_picture('doc_generator/PlotQA/' + str(random.randint(a=0, b=33656)) + '.png',
+        doc.add_picture(os.path.join(PLOTQA_DIR, f'{random.randint(a=0, b=PLOTQA_COUNT - 1)}.png'),
                         width=Inches(random.choice_enum_item((5, 5.5, 6))))
     if image_note == 1:
         paragraph = doc.add_paragraph()
         run = paragraph.add_run(str('Рисунок ' + str(num_of_pictures) + ' — ' + ' '.join(
-            generic.text.words(quantity=random.randint(a=1, b=3)))))
+            ctx.text.words(quantity=random.randint(a=1, b=3)))))
         run.font.size = Pt(based_font_size)
         num_of_pictures += 1
 
 
-def generate_document(path):
+def generate_document(path, seed=None, ctx=None):
     """
     Запуск генерации документа.
     Создает документ, выбирает базовый размер шрифта и сам шрифт.
     После этого выбирает количество итераций генерации элементов.
     Генерирует NUM_ITERATIONS раз все элементы, вызывая функции выше.
+    Если задан seed, документ воспроизводим: тот же сид -- тот же файл байт в байт.
+    ctx -- контекст генератора, по умолчанию общий для процесса.
     """
-    document = Document()
+    ctx = ctx or get_context()
+    if seed is not None:
+        ctx.reseed(seed)
+    document = Document(io.BytesIO(ctx.template))
     table_styles = [style.name for style in document.styles if style.type == WD_STYLE_TYPE.TABLE]
 
     # Начальные характеристики документа
@@ -493,19 +714,18 @@ def generate_document(path):
     random_heading_format = RandomHeadingFormat(random_paragraph_format)
 
     num_of_pictures = 1
-    latex_data = pd.read_csv(r'doc_generator/latex_for_formulas.csv', index_col=False)['formula']
 
     footnote_type = random.choices([0, 1], weights=[40, 60])[0]
 
     element_funcs = []
-    element_funcs += [lambda: add_heading(document, random_heading_format)] * random.randint(1, 3)
-    element_funcs += [lambda: add_paragraph(document, random_paragraph_format)] * random.randint(2, 5)
-    element_funcs += [lambda: get_table(document, random_paragraph_format.font_size)] * random.randint(1, 2)
-    element_funcs += [lambda: add_picture_with_caption(document, random_paragraph_format.font_size)] * random.randint(1, 2)
-    element_funcs += [lambda: add_numbered_list(document, random_paragraph_format)] * random.randint(1, 2)
-    element_funcs += [lambda: add_bulleted_list(document, random_paragraph_format)] * random.randint(1, 3)
-    element_funcs += [lambda: get_formula(document, latex_data)] * random.randint(1, 4)
-    element_funcs += [lambda: add_multicolumn_text(document, random_paragraph_format.font_size)] * random.randint(1, 3)
+    element_funcs += [lambda: add_heading(document, random_heading_format, ctx)] * random.randint(1, 3)
+    element_funcs += [lambda: add_paragraph(document, random_paragraph_format, ctx)] * random.randint(2, 5)
+    element_funcs += [lambda: get_table(document, random_paragraph_format.font_size, ctx)] * random.randint(1, 2)
+    element_funcs += [lambda: add_picture_with_caption(document, random_paragraph_format.font_size, ctx)] * random.randint(1, 2)
+    element_funcs += [lambda: add_numbered_list(document, random_paragraph_format, ctx)] * random.randint(1, 2)
+    element_funcs += [lambda: add_bulleted_list(document, random_paragraph_format, ctx)] * random.randint(1, 3)
+    element_funcs += [lambda: get_formula(document, ctx)] * random.randint(1, 4)
+    element_funcs += [lambda: add_multicolumn_text(document, random_paragraph_format.font_size, ctx)] * random.randint(1, 3)
 
     for i in range(NUM_ITERATIONS):
         # Добавление новой секции на новой странице, кроме первой
@@ -513,21 +733,21 @@ def generate_document(path):
         if i != 0:
             document.add_section(WD_SECTION.NEW_PAGE)
         elif (footnote_type == 1):
-            add_header(document, random_paragraph_format.font_size)
-            get_footnote(document, random_paragraph_format.font_size)
+            add_header(document, random_paragraph_format.font_size, ctx)
+            get_footnote(document, random_paragraph_format.font_size, ctx)
         else:
-            add_header(document, random_paragraph_format.font_size)
-            add_footer(document, random_paragraph_format.font_size)
+            add_header(document, random_paragraph_format.font_size, ctx)
+            add_footer(document, random_paragraph_format.font_size, ctx)
 
         # Изменение ориентации страницы с вероятностью 15%
         vertical = random.random() < 0.85
         change_orientation(document, vertical)
 
         # Добавление заголовка
-        add_heading(document, random_heading_format)
+        add_heading(document, random_heading_format, ctx)
 
         # Добавление абзаца
-        add_paragraph(document, random_paragraph_format)
+        add_paragraph(document, random_paragraph_format, ctx)
 
         # Для фикса бага с мультиколонками
         last_was_paragraph = True
@@ -556,6 +776,6 @@ def generate_document(path):
             func()
 
         if footnote_type == 0:
-            add_footnotes_section(document, random_paragraph_format)
+            add_footnotes_section(document, random_paragraph_format, ctx)
 
-    document.save(path)
\ No newline at end of file
+    save_document(document, path)
\ No newline at end of file
@@ -0,0 +1,76 @@
+import argparse
+import json
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from doc_generator.doc_generator import CHART_BANK_DIR, document_seed, get_context, render_chart
+from tqdm import tqdm
+
+BANK_SIZE = 500  # Сколько графиков хранить в банке (~20-40 КБ каждый)
+REFRESH = 0.0  # Какую долю уже собранного банка перерисовать при повторном запуске
+SEED = 0
+
+
+def render_one(path, seed):
+    ctx = get_context(chart_reuse=0)  # Банк рисует графики только заново
+    ctx.reseed(seed)
+    data = render_chart(ctx)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+
+def build_chart_bank(bank_dir=CHART_BANK_DIR, size=BANK_SIZE, refresh=REFRESH, seed=SEED, workers=None):
+    """
+    Рисует банк из size графиков той же функцией, что и генератор документов.
+    Повторный запуск дорисовывает недостающие графики и перерисовывает долю refresh старых с новыми сидами,
+    чтобы графики в датасете не повторялись от запуска к запуску.
+    """
+    os.makedirs(bank_dir, exist_ok=True)
+    index_path = os.path.join(bank_dir, 'index.json')
+    index = {'generation': 0, 'seeds': {}}
+    if os.path.exists(index_path):
+        with open(index_path, encoding='utf-8') as f:
+            index = json.load(f)
+    generation = index['generation'] + 1
+
+    names = [f'chart_{i:05d}.png' for i in range(size)]
+    existing = [name for name in names if name in index['seeds'] and os.path.exists(os.path.join(bank_dir, name))]
+    refreshed = random.Random(f"{seed}:{generation}").sample(existing, int(len(existing) * refresh))
+    to_render = [name for name in names if name not in existing] + refreshed
+
+    # Графики сверх нового размера банка удаляются
+    for name in set(index['seeds']) - set(names):
+        if os.path.exists(os.path.join(bank_dir, name)):
+            os.remove(os.path.join(bank_dir, name))
+        del index['seeds'][name]
+
+    seeds = {name: document_seed(seed, f"{generation}:{name}") for name in to_render}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(render_one, os.path.join(bank_dir, name), seeds[name]) for name in to_render]
+        for future in tqdm(futures, desc="Рисование графиков"):
+            future.result()
+
+    index['generation'] = generation
+    index['seeds'].update(seeds)
+    with open(index_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    print(f"Графиков в банке: {len(names)}, нарисовано заново: {len(to_render)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Банк заранее нарисованных графиков для генератора документов")
+    parser.add_argument("--size", type=int, default=BANK_SIZE)
+    parser.add_argument("--refresh", type=float, default=REFRESH, help="Доля старых графиков, которую перерисовать")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--workers", type=int, default=None, help="Число процессов (по умолчанию все ядра)")
+    parser.add_argument("--output-dir", default=CHART_BANK_DIR)
+    args = parser.parse_args()
+
+    build_chart_bank(args.output_dir, args.size, args.refresh, args.seed, args.workers)
+
+
+if __name__ == "__main__":
+    main()
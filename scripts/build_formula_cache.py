@@ -0,0 +1,40 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from doc_generator.doc_generator import LATEX_CSV, OMML_CACHE, convert_formula, formula_key
+import pandas as pd
+from tqdm import tqdm
+
+
+def build_formula_cache(latex_csv=LATEX_CSV, output_path=OMML_CACHE, workers=None):
+    """Конвертирует все формулы из CSV в OMML один раз и сохраняет их в JSON: хэш LaTeX -> OMML."""
+    formulas = sorted(set(pd.read_csv(latex_csv, index_col=False)['formula']))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        omml = list(tqdm(executor.map(convert_formula, formulas, chunksize=32), total=len(formulas),
+                         desc="Конвертация формул"))
+    cache = {formula_key(latex): fragment for latex, fragment in zip(formulas, omml)}
+
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, sort_keys=True)
+    os.replace(tmp_path, output_path)
+
+    failed = sum(fragment is None for fragment in omml)
+    print(f"Сохранено формул: {len(cache)}, не конвертируются (будут пропускаться): {failed}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Предварительная конвертация формул LaTeX в OMML для генератора")
+    parser.add_argument("--latex-csv", default=LATEX_CSV)
+    parser.add_argument("--output", default=OMML_CACHE)
+    parser.add_argument("--workers", type=int, default=None, help="Число процессов (по умолчанию все ядра)")
+    args = parser.parse_args()
+
+    build_formula_cache(args.latex_csv, args.output, args.workers)
+
+
+if __name__ == "__main__":
+    main()
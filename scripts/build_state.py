@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import threading
+
+STATE_DIR = 'data/build_state/'
+SAVE_EVERY = 50  # Как часто сбрасывать состояние на диск, чтобы прерванный запуск не терял сделанное
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(2 ** 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BuildState:
+    """
+    Состояние одной стадии конвейера данных: для каждого входного файла -- хэш содержимого,
+    выходные файлы и версия инструмента, которым они сделаны. По нему стадия обрабатывает только новые
+    и изменившиеся входы, а выходы удалённых входов удаляет.
+
+    Хэш пересчитывается, только если у файла изменились размер или mtime.
+    """
+
+    def __init__(self, stage, tool_version, state_dir=STATE_DIR):
+        self.path = os.path.join(state_dir, f'{stage}.json')
+        self.tool_version = str(tool_version)
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                self.entries = json.load(f)
+        self._hashes = {}
+        self._lock = threading.Lock()
+        self._unsaved = 0
+
+    def _hash(self, input_path):
+        if input_path not in self._hashes:
+            self._hashes[input_path] = file_hash(input_path)
+        return self._hashes[input_path]
+
+    def needs_build(self, input_path):
+        key = os.path.normpath(input_path)
+        entry = self.entries.get(key)
+        if entry is None or entry['version'] != self.tool_version:
+            return True
+        if not all(os.path.exists(output) for output in entry['outputs']):
+            return True
+        stat = os.stat(input_path)
+        if entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return False
+        if self._hash(key) != entry['hash']:
+            return True
+        # Файл только «потрогали»: запоминаем новые размер и mtime, чтобы не хэшировать его при каждом запуске
+        with self._lock:
+            entry['size'] = stat.st_size
+            entry['mtime_ns'] = stat.st_mtime_ns
+            self._unsaved += 1
+        return False
+
+    def is_recorded(self, input_path):
+        """
+        Вход обработан текущей версией и его выходы на месте. Сам вход не проверяется:
+        для промежуточных файлов, удалённых после обработки, больше ничего проверить нельзя.
+        """
+        entry = self.entries.get(os.path.normpath(input_path))
+        return (entry is not None and entry['version'] == self.tool_version
+                and all(os.path.exists(output) for output in entry['outputs']))
+
+    def pending(self, input_paths):
+        """Входы, которые нужно (пере)обработать."""
+        return [path for path in input_paths if self.needs_build(path)]
+
+    def record(self, input_path, outputs):
+        """Отмечает вход обработанным; выходы прошлой сборки, которых больше нет среди outputs, удаляются."""
+        key = os.path.normpath(input_path)
+        stat = os.stat(key)
+        entry = {
+            'hash': self._hash(key),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'outputs': [os.path.normpath(output) for output in outputs],
+            'version': self.tool_version,
+        }
+        with self._lock:
+            old = self.entries.get(key)
+            self.entries[key] = entry
+            self._unsaved += 1
+            need_save = self._unsaved >= SAVE_EVERY
+        if old is not None:
+            for output in set(old['outputs']) - set(entry['outputs']):
+                if os.path.exists(output):
+                    os.remove(output)
+        if need_save:
+            self.save()
+
+    def prune(self, input_paths):
+        """Удаляет выходы и записи входов, которых больше нет. Возвращает число удалённых входов."""
+        current = {os.path.normpath(path) for path in input_paths}
+        with self._lock:
+            removed = [key for key in self.entries if key not in current]
+            for key in removed:
+                for output in self.entries.pop(key)['outputs']:
+                    if os.path.exists(output):
+                        os.remove(output)
+        if removed:
+            self.save()
+        return len(removed)
+
+    def save(self):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+            self._unsaved = 0
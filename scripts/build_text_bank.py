@@ -0,0 +1,70 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from doc_generator.doc_generator import TEXT_BANK, document_seed, get_context
+from tqdm import tqdm
+
+# Длины, которые запрашивает генератор: fake.sentence(nb_words=1..50), fake.text(max_nb_chars=400..1000 и 2000..4000)
+SENTENCE_LENGTHS = range(1, 51)
+TEXT_LENGTHS = list(range(400, 1001, 100)) + list(range(2000, 4001, 100))
+SENTENCES_PER_LENGTH = 200
+TEXTS_PER_LENGTH = 50
+NUM_FAKE_WORDS = 5000
+NUM_MIMESIS_SENTENCES = 5000
+NUM_WORDS = 20000
+SEED = 0
+
+
+def generate_pool(kind, param, count, seed):
+    """Одна часть банка, сгенерированная теми же провайдерами, что и документы."""
+    ctx = get_context(chart_reuse=0)
+    ctx.reseed(seed)
+    text = ctx.text
+    if kind == 'sentences':
+        return [text.sentence(param) for _ in range(count)]
+    if kind == 'texts':
+        return [text.text(param) for _ in range(count)]
+    if kind == 'fake_words':
+        return [text.word() for _ in range(count)]
+    if kind == 'mimesis_sentences':
+        return [text.mimesis_text(1) for _ in range(count)]
+    return text.words(count)
+
+
+def build_text_bank(output_path=TEXT_BANK, seed=SEED, workers=None):
+    tasks = [('sentences', n, SENTENCES_PER_LENGTH) for n in SENTENCE_LENGTHS]
+    tasks += [('texts', n, TEXTS_PER_LENGTH) for n in TEXT_LENGTHS]
+    tasks += [('fake_words', None, NUM_FAKE_WORDS), ('mimesis_sentences', None, NUM_MIMESIS_SENTENCES),
+              ('words', None, NUM_WORDS)]
+
+    bank = {'sentences': {}, 'texts': {}}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(generate_pool, kind, param, count, document_seed(seed, f"{kind}:{param}"))
+                   for kind, param, count in tasks]
+        for (kind, param, _), future in tqdm(zip(tasks, futures), total=len(tasks), desc="Генерация текста"):
+            if param is None:
+                bank[kind] = future.result()
+            else:
+                bank[kind][str(param)] = future.result()
+
+    with open(output_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(bank, f, ensure_ascii=False)
+    os.replace(output_path + '.tmp', output_path)
+    print(f"Банк текста сохранён в {output_path} ({os.path.getsize(output_path) / 2 ** 20:.1f} МБ)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Банк заранее сгенерированного текста для генератора документов")
+    parser.add_argument("--output", default=TEXT_BANK)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--workers", type=int, default=None, help="Число процессов (по умолчанию все ядра)")
+    args = parser.parse_args()
+
+    build_text_bank(args.output, args.seed, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,37 @@
 import os
+from importlib.metadata import version
 from docx2pdf import convert
 from tqdm import tqdm
+from build_state import BuildState
+from convert_to_pdf_linux import pdf_path, remove_partial
 
 DOCX_DIR = 'data/docx/'
 PDF_DIR = 'data/pdf/'
-os.makedirs(PDF_DIR, exist_ok=True)
 
-docx_files = [f for f in os.listdir(DOCX_DIR) if f.endswith('.docx')]
 
-for docx_file in tqdm(docx_files, desc="Конвертация DOCX в PDF"):
-    input_path = os.path.join(DOCX_DIR, docx_file)
-    output_path = os.path.join(PDF_DIR, os.path.splitext(docx_file)[0] + '.pdf')
-    try:
-        convert(input_path, output_path)
-    except Exception as e:
-        print(f"Ошибка конвертации {docx_file}: {e}")
\ No newline at end of file
+def main():
+    os.makedirs(PDF_DIR, exist_ok=True)
+    docx_paths = sorted(os.path.join(DOCX_DIR, f) for f in os.listdir(DOCX_DIR) if f.endswith('.docx'))
+
+    # Конвертируются только новые и изменившиеся документы, PDF удалённых документов удаляются
+    state = BuildState('convert_to_pdf', f"docx2pdf {version('docx2pdf')}")
+    removed = state.prune(docx_paths)
+    todo = state.pending(docx_paths)
+    print(f"DOCX: {len(docx_paths)}, к конвертации: {len(todo)}, удалено устаревших PDF: {removed}")
+
+    for input_path in todo:  # Старый PDF не должен сойти за результат, если конвертация не удастся
+        remove_partial(pdf_path(input_path, PDF_DIR))
+
+    for input_path in tqdm(todo, desc="Конвертация DOCX в PDF"):
+        output_path = pdf_path(input_path, PDF_DIR)
+        try:
+            convert(input_path, output_path)
+            state.record(input_path, [output_path])
+        except Exception as e:
+            remove_partial(output_path)
+            print(f"Ошибка конвертации {input_path}: {e}")
+    state.save()
+
+
+if __name__ == "__main__":
+    main()
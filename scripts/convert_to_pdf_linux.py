@@ -1,16 +1,380 @@
+import argparse
+import queue
+import signal
 import subprocess
 import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+from build_state import BuildState
+
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+    from com.sun.star.connection import NoConnectException
+except ImportError:  # pyuno есть только у Python из поставки LibreOffice (пакет python3-uno)
+    uno = None
 
 DOCX_DIR = 'data/docx/'
 PDF_DIR = 'data/pdf/'
-os.makedirs(PDF_DIR, exist_ok=True)
 
-docx_files = [f for f in os.listdir(DOCX_DIR) if f.endswith('.docx')]
+SOFFICE = 'libreoffice'
+OFFICE_PORT = 2002
+STARTUP_TIMEOUT = 60  # Сколько секунд ждать, пока запущенный офис начнёт принимать подключения
+BATCH_CHUNK = 200  # Сколько файлов передавать в один вызов --convert-to
+FILE_TIMEOUT = 120  # Сколько секунд даётся на один файл, после этого зависший офис убивается и перезапускается
+PROFILES_DIR = os.path.join(tempfile.gettempdir(), 'lo_profiles')  # Свой профиль LibreOffice у каждого воркера
+
+
+def _props(**values):
+    props = []
+    for name, value in values.items():
+        prop = PropertyValue()
+        prop.Name = name
+        prop.Value = value
+        props.append(prop)
+    return tuple(props)
+
+
+def office_command(soffice, profile_dir=None):
+    """Команда запуска офиса; с profile_dir у процесса свой профиль и он не конфликтует с соседними."""
+    command = [soffice]
+    if profile_dir is not None:
+        command.append('-env:UserInstallation=file://' + os.path.abspath(profile_dir))
+    return command + ['--headless', '--invisible', '--nologo', '--norestore', '--nodefault']
+
+
+def kill_office(process):
+    """Убивает офис вместе с дочерними процессами (libreoffice -> oosplash -> soffice.bin)."""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+
+class OfficeConverter:
+    """
+    Один запущенный headless LibreOffice, которому документы отправляются через UNO по локальному сокету.
+    Запуск офиса (несколько секунд) оплачивается один раз, а не на каждый файл.
+    """
+
+    def __init__(self, port=OFFICE_PORT, soffice=SOFFICE, profile_dir=None):
+        self.port = port
+        self.soffice = soffice
+        self.profile_dir = profile_dir
+        self.process = None
+        self.desktop = None
+
+    def start(self):
+        connection = f"socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext"
+        self.process = subprocess.Popen(office_command(self.soffice, self.profile_dir) + [f'--accept={connection}'],
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+
+        local_context = uno.getComponentContext()
+        resolver = local_context.ServiceManager.createInstanceWithContext("com.sun.star.bridge.UnoUrlResolver",
+                                                                          local_context)
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while True:
+            try:
+                context = resolver.resolve(f"uno:{connection}")
+                break
+            except NoConnectException:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.close()
+                    raise RuntimeError(f"LibreOffice не запустился на порту {self.port}")
+                time.sleep(0.5)
+        self.desktop = context.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", context)
+
+    def convert(self, input_path, output_path):
+        url = uno.systemPathToFileUrl(os.path.abspath(input_path))
+        document = self.desktop.loadComponentFromURL(url, "_blank", 0, _props(Hidden=True, ReadOnly=True))
+        if document is None:
+            raise RuntimeError(f"LibreOffice не смог открыть {input_path}")
+        try:
+            document.storeToURL(uno.systemPathToFileUrl(os.path.abspath(output_path)),
+                                _props(FilterName="writer_pdf_Export"))
+        finally:
+            document.close(True)
+
+    def kill(self):
+        """Аварийная остановка, например, из сторожевого потока: зависший вызов convert сразу падает с ошибкой."""
+        if self.process is not None and self.process.poll() is None:
+            kill_office(self.process)
+
+    def close(self):
+        if self.desktop is not None:
+            try:
+                self.desktop.terminate()
+            except Exception:
+                pass  # Офис уже упал или закрылся
+            self.desktop = None
+        if self.process is not None:
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                kill_office(self.process)
+            self.process = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def office_version(soffice=SOFFICE):
+    try:
+        result = subprocess.run([soffice, '--version'], capture_output=True, text=True, timeout=STARTUP_TIMEOUT)
+        return result.stdout.strip() or soffice
+    except (OSError, subprocess.TimeoutExpired):
+        return soffice
+
+
+def pdf_path(input_path, pdf_dir):
+    return os.path.join(pdf_dir, os.path.splitext(os.path.basename(input_path))[0] + '.pdf')
+
+
+def remove_partial(output_path):
+    """Удаляет выход неудавшейся конвертации, чтобы недописанный PDF не сошёл за готовый."""
+    if output_path is not None and os.path.exists(output_path):
+        os.remove(output_path)
+
 
-for docx_file in docx_files:
-    input_path = os.path.join(DOCX_DIR, docx_file)
-    output_path = os.path.join(PDF_DIR, os.path.splitext(docx_file)[0] + '.pdf')
+class ConversionPool:
+    """
+    Несколько офисов, каждый со своим портом и своим профилем (-env:UserInstallation), забирают файлы
+    из общей очереди. Сторожевой поток убивает офис, который дольше timeout секунд занят одним файлом;
+    файл считается неудавшимся, а воркер перезапускает свой офис и берёт следующий.
+    """
+
+    def __init__(self, workers=None, soffice=SOFFICE, base_port=OFFICE_PORT, profiles_dir=PROFILES_DIR,
+                 timeout=FILE_TIMEOUT):
+        self.workers = workers or os.cpu_count() or 1
+        self.soffice = soffice
+        self.base_port = base_port
+        self.profiles_dir = profiles_dir
+        self.timeout = timeout
+        self._converters = [None] * self.workers
+        self._deadlines = [None] * self.workers
+        self._timed_out = [False] * self.workers
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def _start_converter(self, worker_id):
+        converter = OfficeConverter(self.base_port + worker_id, self.soffice,
+                                    os.path.join(self.profiles_dir, f'worker_{worker_id}'))
+        converter.start()
+        self._converters[worker_id] = converter
+        return converter
+
+    def _watchdog(self):
+        while not self._stopped.wait(1):
+            for worker_id in range(self.workers):
+                self._kill_if_overdue(worker_id)
+
+    def _kill_if_overdue(self, worker_id):
+        """
+        Срок проверяется и снимается под той же блокировкой, под которой воркер отмечает конец файла,
+        поэтому офис, уже закончивший файл, не убивается.
+        """
+        with self._lock:
+            deadline = self._deadlines[worker_id]
+            if deadline is None or time.monotonic() <= deadline:
+                return
+            self._deadlines[worker_id] = None
+            self._timed_out[worker_id] = True
+            self._converters[worker_id].kill()
+
+    def _finish_file(self, worker_id):
+        """Снимает срок файла; возвращает True, если сторож успел убить офис."""
+        with self._lock:
+            self._deadlines[worker_id] = None
+            return self._timed_out[worker_id]
+
+    def _restart_converter(self, worker_id, converter):
+        converter.close()
+        try:
+            return self._start_converter(worker_id)
+        except Exception as e:
+            print(f"Воркер {worker_id} не перезапустил LibreOffice: {e}")
+            return None
+
+    def _worker(self, worker_id, tasks, pdf_dir, on_done):
+        try:
+            converter = self._start_converter(worker_id)
+        except Exception as e:
+            print(f"Воркер {worker_id} не запустил LibreOffice: {e}")
+            return
+        try:
+            while True:
+                input_path = tasks.get()
+                if input_path is None:
+                    tasks.put(None)  # Конец очереди видят и остальные воркеры
+                    break
+                output_path = pdf_path(input_path, pdf_dir)
+                with self._lock:
+                    self._deadlines[worker_id] = time.monotonic() + self.timeout
+                    self._timed_out[worker_id] = False
+                error = None
+                try:
+                    converter.convert(input_path, output_path)
+                except Exception as e:
+                    error = e
+                timed_out = self._finish_file(worker_id)
+
+                if error is not None:
+                    remove_partial(output_path)  # Убитый офис мог оставить недописанный PDF
+                    output_path = None
+                    if timed_out:
+                        print(f"Конвертация {input_path} дольше {self.timeout} с, офис воркера {worker_id} перезапущен")
+                    else:
+                        print(f"Ошибка конвертации {input_path}: {error}")
+                on_done(input_path, output_path)
+
+                # Офис убит сторожем (в том числе в тот момент, когда файл уже сохранён) или упал сам
+                if timed_out or converter.process.poll() is not None:
+                    converter = self._restart_converter(worker_id, converter)
+                    if converter is None:
+                        return
+        finally:
+            if converter is not None:
+                converter.close()
+
+    def serve(self, tasks, pdf_dir, on_done):
+        """
+        Конвертирует файлы из очереди tasks, пока в ней не встретится None.
+        После каждого файла вызывается on_done(путь к DOCX, путь к PDF или None при ошибке).
+        """
+        watchdog = threading.Thread(target=self._watchdog, daemon=True)
+        watchdog.start()
+        threads = [threading.Thread(target=self._worker, args=(i, tasks, pdf_dir, on_done))
+                   for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self._stopped.set()
+
+    def run(self, docx_paths, pdf_dir):
+        """Конвертирует файлы и возвращает список тех, что сконвертировать не удалось."""
+        tasks = queue.Queue()
+        for path in docx_paths:
+            tasks.put(path)
+        tasks.put(None)
+        failed = []
+        with tqdm(total=len(docx_paths), desc=f"Конвертация DOCX в PDF ({self.workers} офисов)") as progress:
+            def on_done(input_path, output_path):
+                if output_path is None:
+                    failed.append(input_path)
+                progress.update(1)
+
+            self.serve(tasks, pdf_dir, on_done)
+        # Если офисы не запустились, в очереди остаются необработанные файлы
+        while not tasks.empty():
+            input_path = tasks.get_nowait()
+            if input_path is not None:
+                failed.append(input_path)
+        return failed
+
+
+def convert_chunk(chunk, pdf_dir, soffice, profile_dir, timeout):
+    """Конвертирует пачку одним вызовом --convert-to и возвращает список файлов, которые не удались."""
+    process = subprocess.Popen(office_command(soffice, profile_dir) + ['--convert-to', 'pdf', '--outdir', pdf_dir, *chunk],
+                               stdout=subprocess.DEVNULL, start_new_session=True)
     try:
-        subprocess.run(['libreoffice', '--headless', '--convert-to', 'pdf', input_path, '--outdir', PDF_DIR], check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"Ошибка конвертации {docx_file}: {e}")
\ No newline at end of file
+        returncode = process.wait(timeout=timeout * len(chunk))
+    except subprocess.TimeoutExpired:
+        kill_office(process)
+        print(f"Пачка из {len(chunk)} файлов ({chunk[0]}...) не уложилась в {timeout * len(chunk)} с и остановлена")
+        # Какой файл офис писал в момент остановки, неизвестно, поэтому неудавшейся считается вся пачка
+        failed = list(chunk)
+    else:
+        if returncode != 0:
+            print(f"Ошибка конвертации пачки из {len(chunk)} файлов ({chunk[0]}...): код {returncode}")
+        failed = [path for path in chunk if not os.path.exists(pdf_path(path, pdf_dir))]
+    for path in failed:
+        remove_partial(pdf_path(path, pdf_dir))
+    return failed
+
+
+def convert_batch(docx_paths, pdf_dir, soffice=SOFFICE, chunk_size=BATCH_CHUNK, workers=1,
+                  profiles_dir=PROFILES_DIR, timeout=FILE_TIMEOUT):
+    """
+    Запасной режим без UNO: много файлов в одном вызове --convert-to, офис запускается раз на пачку.
+    Пачки делятся между workers параллельными офисами, у каждого свой профиль.
+    Возвращает список файлов, которые сконвертировать не удалось.
+    """
+    chunk_size = min(chunk_size, max(1, -(-len(docx_paths) // workers)))  # Чтобы работы хватило всем офисам
+    chunks = [docx_paths[start:start + chunk_size] for start in range(0, len(docx_paths), chunk_size)]
+    free_profiles = queue.Queue()
+    for worker_id in range(workers):
+        free_profiles.put(os.path.join(profiles_dir, f'worker_{worker_id}'))
+
+    def run_chunk(chunk):
+        profile_dir = free_profiles.get()
+        try:
+            return convert_chunk(chunk, pdf_dir, soffice, profile_dir, timeout)
+        finally:
+            free_profiles.put(profile_dir)
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for chunk_failed in tqdm(executor.map(run_chunk, chunks), total=len(chunks),
+                                 desc="Конвертация DOCX в PDF (пачками)"):
+            failed.extend(chunk_failed)
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Конвертация DOCX в PDF через LibreOffice")
+    parser.add_argument("--mode", choices=["uno", "batch"], default="uno" if uno is not None else "batch",
+                        help="uno -- постоянно запущенный офис (нужен python3-uno), batch -- пачки через --convert-to")
+    parser.add_argument("--input-dir", default=DOCX_DIR)
+    parser.add_argument("--output-dir", default=PDF_DIR)
+    parser.add_argument("--soffice", default=SOFFICE, help="Команда запуска LibreOffice")
+    parser.add_argument("--port", type=int, default=OFFICE_PORT, help="Порт первого офиса, у остальных следующие")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Сколько офисов запускать параллельно")
+    parser.add_argument("--timeout", type=float, default=FILE_TIMEOUT, help="Лимит времени на один файл, секунды")
+    parser.add_argument("--profiles-dir", default=PROFILES_DIR, help="Папка для профилей LibreOffice воркеров")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    docx_paths = sorted(os.path.join(args.input_dir, f) for f in os.listdir(args.input_dir) if f.endswith('.docx'))
+    if args.mode == "uno" and uno is None:
+        parser.error("Для режима uno нужен модуль uno (python3-uno), используйте --mode batch")
+
+    # Конвертируются только новые и изменившиеся документы, PDF удалённых документов удаляются
+    state = BuildState('convert_to_pdf', office_version(args.soffice))
+    removed = state.prune(docx_paths)
+    todo = state.pending(docx_paths)
+    print(f"DOCX: {len(docx_paths)}, к конвертации: {len(todo)}, удалено устаревших PDF: {removed}")
+    for input_path in todo:  # Старый PDF не должен сойти за результат, если конвертация не удастся
+        if os.path.exists(pdf_path(input_path, args.output_dir)):
+            os.remove(pdf_path(input_path, args.output_dir))
+
+    if args.mode == "uno":
+        pool = ConversionPool(args.workers, args.soffice, args.port, args.profiles_dir, args.timeout)
+        failed = pool.run(todo, args.output_dir)
+    else:
+        failed = convert_batch(todo, args.output_dir, args.soffice, workers=args.workers,
+                               profiles_dir=args.profiles_dir, timeout=args.timeout)
+
+    # Успех определяется по результату конвертации, а не по наличию файла: после сбоя PDF может быть недописан
+    failed = set(failed)
+    for input_path in failed:
+        remove_partial(pdf_path(input_path, args.output_dir))
+    for input_path in todo:
+        if input_path not in failed and os.path.exists(pdf_path(input_path, args.output_dir)):
+            state.record(input_path, [pdf_path(input_path, args.output_dir)])
+    state.save()
+    if failed:
+        print(f"Не сконвертировано файлов: {len(failed)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,11 +7,15 @@ from enum import Enum
 # не менять на fitz, иначе у Тимофея не зафурычит
 import pymupdf
 from PIL import Image, ImageDraw
+from build_state import BuildState, file_hash
 
 # Папки с данными
 PDF_DIR = 'data/pdf/'
 ANNOTATIONS_DIR = 'data/annotations/'
 
+# Версия разметки -- хэш этого скрипта: после правки правил разметка пересчитывается
+ANNOTATIONS_VERSION = f"pymupdf {pymupdf.VersionBind}, {file_hash(__file__)}"
+
 
 class ElementType(Enum):
     PICTURE = 0
@@ -59,163 +63,161 @@ class DocumentAnalyzer:
 
     def extract_coordinates(self, pdf_path):
         """Извлекает координаты всех элементов, классифицируя их"""
-        doc = pymupdf.open(pdf_path)
         page_data = []
         tables = self.tables_find(pdf_path)
         paragraph_lines_count = 0
         paragraphs_font_sizes = []
 
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            page_dict = {
-                'image_height': int(page.rect.height),
-                'image_width': int(page.rect.width),
-                'image_path': f'page_{page_num + 1}.png',
-                'title': [],
-                'paragraph': [],
-                'table': [],
-                'picture': [],
-                'table_signature': [],
-                'picture_signature': [],
-                'numbered_list': [],
-                'marked_list': [],
-                'header': [],
-                'footer': [],
-                'footnote': [],
-                'formula': []
-            }
-
-            table_areas = tables.get(page_num, [])
-            if page_num in tables:
-                for bbox in tables[page_num]:
-                    page_dict['table'].append(self._convert_coordinates(bbox))
-
-            # Сначала извлекаем текст ПЕРВОЙ страницы для вычисления базового размера шрифта
-            if page_num == 0:
-                paragraphs = []
-                page = doc[0]
+        with pymupdf.open(pdf_path) as doc:
+            for page_num in range(len(doc)):
+                page = doc[page_num]
+                page_dict = {
+                    'image_height': int(page.rect.height),
+                    'image_width': int(page.rect.width),
+                    'image_path': f'page_{page_num + 1}.png',
+                    'title': [],
+                    'paragraph': [],
+                    'table': [],
+                    'picture': [],
+                    'table_signature': [],
+                    'picture_signature': [],
+                    'numbered_list': [],
+                    'marked_list': [],
+                    'header': [],
+                    'footer': [],
+                    'footnote': [],
+                    'formula': []
+                }
+
+                table_areas = tables.get(page_num, [])
+                if page_num in tables:
+                    for bbox in tables[page_num]:
+                        page_dict['table'].append(self._convert_coordinates(bbox))
+
+                # Сначала извлекаем текст ПЕРВОЙ страницы для вычисления базового размера шрифта
+                if page_num == 0:
+                    paragraphs = []
+                    page = doc[0]
+                    blocks = page.get_text("dict")["blocks"]
+                    prev_line = None
+                    line = None
+
+                    for block in blocks:
+                        block_bbox = block["bbox"]
+
+                        if not self.line_spacing:
+                            if not self._is_header(block['bbox']) and not self._is_footer(block['bbox'],
+                                                                                          page.rect.height) and not self._is_footnote(
+                                    block, page.rect.height):
+                                line = block
+                                if not prev_line:
+                                    prev_line = line
+                                else:
+                                    self.line_spacing = line['bbox'][1] - prev_line['bbox'][3]
+
+                        # Проверяем, находится ли блок в одной из областей таблицы
+                        is_in_table_area = any(
+                            self._is_within_table(block_bbox, table_area) for table_area in table_areas
+                        )
+
+                        # Если блок не в таблице, добавляем его текст для анализа
+                        if not is_in_table_area:
+                            text = self.extract_text_from_block(block)
+                            if text:
+                                paragraphs.append(block)
+
+                    # Теперь вычисляем базовый размер шрифта на основе этих параграфов
+                    if self.base_font_size is None:
+                        self.base_font_size = self.get_base_font_size(paragraphs)
+
+                # Все содержимое документа разбивается на блоки
                 blocks = page.get_text("dict")["blocks"]
-                prev_line = None
-                line = None
 
                 for block in blocks:
-                    block_bbox = block["bbox"]
-
-                    if not self.line_spacing:
-                        if not self._is_header(block['bbox']) and not self._is_footer(block['bbox'],
-                                                                                      page.rect.height) and not self._is_footnote(
-                                block, page.rect.height):
-                            line = block
-                            if not prev_line:
-                                prev_line = line
-                            else:
-                                self.line_spacing = line['bbox'][1] - prev_line['bbox'][3]
-
-                    # Проверяем, находится ли блок в одной из областей таблицы
-                    is_in_table_area = any(
-                        self._is_within_table(block_bbox, table_area) for table_area in table_areas
-                    )
-
-                    # Если блок не в таблице, добавляем его текст для анализа
-                    if not is_in_table_area:
-                        text = self.extract_text_from_block(block)
-                        if text:
-                            paragraphs.append(block)
-
-                # Теперь вычисляем базовый размер шрифта на основе этих параграфов
-                if self.base_font_size is None:
-                    self.base_font_size = self.get_base_font_size(paragraphs)
-
-            # Все содержимое документа разбивается на блоки
-            blocks = page.get_text("dict")["blocks"]
-
-            for block in blocks:
-                bbox = tuple(block['bbox'])
-                text = self.extract_text_from_block(block)
-                block_type = block['type']
-
-                # Если текст пустой (например пропуск строки) и это не картинка
-                if not text and block_type != 1:
-                    continue
-
-                if any(self._is_within_table(bbox, table) for table in table_areas):
-                    continue
-
-                element_type = None
-                if block_type == 1:  # is_picture
-                    page_dict['picture'].append(self._convert_coordinates(bbox))
-                    element_type = ElementType.PICTURE
-                elif self._is_table_signature(text, block):
-                    page_dict['table_signature'].append(self._convert_coordinates(bbox))
-                    element_type = ElementType.TABLE_SIGNATURE
-                elif self._is_picture_signature(text, block):
-                    page_dict['picture_signature'].append(self._convert_coordinates(bbox))
-                    element_type = ElementType.PICTURE_SIGNATURE
-                elif self._is_header(bbox):
-                    page_dict['header'].append(self._convert_coordinates(bbox))
-                    element_type = ElementType.HEADER
-                elif self._is_numbered_list(block):
-                    page_dict['numbered_list'].append(self._convert_coordinates(bbox))
-                    element_type = ElementType.NUMBERED_LIST
-                elif self._is_marked_list(block):
-                    page_dict['marked_list'].append(self._convert_coordinates(bbox))
-                    element_type = ElementType.MARKED_LIST
-                elif self._is_footer(bbox, page.rect.height):
-                    page_dict['footer'].append(self._convert_coordinates(bbox))
-                    element_type = ElementType.FOOTER
-                elif self._is_formula(block)[0]:
-                    coords = self._convert_coordinates(bbox)
-                    # Если в формуле есть знак суммы, интегралы или знак произведения
-                    # Тогда раздвинем границы вверх и вниз на 5, чтобы они вместились в бокс
-                    if self._is_formula(block)[1]:
-                        coords[1] -= 5
-                        coords[-1] += 5
-                    page_dict['formula'].append(coords)
-                    element_type = ElementType.FORMULA
-                elif self._is_footnote(block, page.rect.height):
-                    page_dict['footnote'].append(self._convert_coordinates(bbox))
-                    element_type = ElementType.FOOTNOTE
-                elif self._is_title(block):
-                    page_dict['title'].append(self._convert_coordinates(bbox))
-                    element_type = ElementType.TITLE
-                else:
-                    page_dict['paragraph'].append(self._convert_coordinates(bbox))
-                    element_type = ElementType.PARAGRAPH
-                    # Складываем шрифты параграфов
-                    for line in block['lines']:
-                        for span in line['spans']:
-                            paragraphs_font_sizes.append(round(span.get('size')))
-                        paragraph_lines_count += 1
-                    # Обновляем базовый размер шрифта, если собрали уже достаточно и если обновление было не так давно
-                    if paragraph_lines_count > 50 and len(paragraphs_font_sizes) > 5:
-                        self.base_font_size = self.update_base_font_size(paragraphs_font_sizes)
-
-                self.prev_element = {
-                    'element_type': element_type,
-                    'text': text,
-                    'bbox': bbox,
-                }
+                    bbox = tuple(block['bbox'])
+                    text = self.extract_text_from_block(block)
+                    block_type = block['type']
+
+                    # Если текст пустой (например пропуск строки) и это не картинка
+                    if not text and block_type != 1:
+                        continue
+
+                    if any(self._is_within_table(bbox, table) for table in table_areas):
+                        continue
+
+                    element_type = None
+                    if block_type == 1:  # is_picture
+                        page_dict['picture'].append(self._convert_coordinates(bbox))
+                        element_type = ElementType.PICTURE
+                    elif self._is_table_signature(text, block):
+                        page_dict['table_signature'].append(self._convert_coordinates(bbox))
+                        element_type = ElementType.TABLE_SIGNATURE
+                    elif self._is_picture_signature(text, block):
+                        page_dict['picture_signature'].append(self._convert_coordinates(bbox))
+                        element_type = ElementType.PICTURE_SIGNATURE
+                    elif self._is_header(bbox):
+                        page_dict['header'].append(self._convert_coordinates(bbox))
+                        element_type = ElementType.HEADER
+                    elif self._is_numbered_list(block):
+                        page_dict['numbered_list'].append(self._convert_coordinates(bbox))
+                        element_type = ElementType.NUMBERED_LIST
+                    elif self._is_marked_list(block):
+                        page_dict['marked_list'].append(self._convert_coordinates(bbox))
+                        element_type = ElementType.MARKED_LIST
+                    elif self._is_footer(bbox, page.rect.height):
+                        page_dict['footer'].append(self._convert_coordinates(bbox))
+                        element_type = ElementType.FOOTER
+                    elif self._is_formula(block)[0]:
+                        coords = self._convert_coordinates(bbox)
+                        # Если в формуле есть знак суммы, интегралы или знак произведения
+                        # Тогда раздвинем границы вверх и вниз на 5, чтобы они вместились в бокс
+                        if self._is_formula(block)[1]:
+                            coords[1] -= 5
+                            coords[-1] += 5
+                        page_dict['formula'].append(coords)
+                        element_type = ElementType.FORMULA
+                    elif self._is_footnote(block, page.rect.height):
+                        page_dict['footnote'].append(self._convert_coordinates(bbox))
+                        element_type = ElementType.FOOTNOTE
+                    elif self._is_title(block):
+                        page_dict['title'].append(self._convert_coordinates(bbox))
+                        element_type = ElementType.TITLE
+                    else:
+                        page_dict['paragraph'].append(self._convert_coordinates(bbox))
+                        element_type = ElementType.PARAGRAPH
+                        # Складываем шрифты параграфов
+                        for line in block['lines']:
+                            for span in line['spans']:
+                                paragraphs_font_sizes.append(round(span.get('size')))
+                            paragraph_lines_count += 1
+                        # Обновляем базовый размер шрифта, если собрали уже достаточно и если обновление было не так давно
+                        if paragraph_lines_count > 50 and len(paragraphs_font_sizes) > 5:
+                            self.base_font_size = self.update_base_font_size(paragraphs_font_sizes)
 
-            # Слияние боксов формул если они рядом или пересекаются
-            page_dict['formula'] = self.merge_rects(page_dict['formula'], max_y_distance=5, max_x_distance=5, check_indent_diff=True)
+                    self.prev_element = {
+                        'element_type': element_type,
+                        'text': text,
+                        'bbox': bbox,
+                    }
 
-            # Слияние боксов текстов (УДАЛИТЬ ЕСЛИ НЕОБХОДИМО)
-            page_dict['paragraph'] = self.merge_rects(page_dict['paragraph'], max_y_distance=10, max_x_distance=0)
+                # Слияние боксов формул если они рядом или пересекаются
+                page_dict['formula'] = self.merge_rects(page_dict['formula'], max_y_distance=5, max_x_distance=5, check_indent_diff=True)
 
-            # Слияние боксов сносок (УДАЛИТЬ ЕСЛИ НЕОБХОДИМО)
-            page_dict['footnote'] = self.merge_rects(page_dict['footnote'], max_y_distance=10, max_x_distance=0)
+                # Слияние боксов текстов (УДАЛИТЬ ЕСЛИ НЕОБХОДИМО)
+                page_dict['paragraph'] = self.merge_rects(page_dict['paragraph'], max_y_distance=10, max_x_distance=0)
 
-            page_dict['numbered_list'] = self.merge_rects(page_dict['numbered_list'], max_y_distance=8, max_x_distance=0)
+                # Слияние боксов сносок (УДАЛИТЬ ЕСЛИ НЕОБХОДИМО)
+                page_dict['footnote'] = self.merge_rects(page_dict['footnote'], max_y_distance=10, max_x_distance=0)
 
-            page_dict['marked_list'] = self.merge_rects(page_dict['marked_list'], max_y_distance=8, max_x_distance=0)
+                page_dict['numbered_list'] = self.merge_rects(page_dict['numbered_list'], max_y_distance=8, max_x_distance=0)
 
-            page_dict['title'] = self.merge_rects(page_dict['title'], max_y_distance=8, max_x_distance=0)
+                page_dict['marked_list'] = self.merge_rects(page_dict['marked_list'], max_y_distance=8, max_x_distance=0)
 
-            page_dict['picture_signature'] = self.merge_rects(page_dict['picture_signature'], max_y_distance=5,
-                                                              max_x_distance=0)
-            page_data.append(page_dict)
+                page_dict['title'] = self.merge_rects(page_dict['title'], max_y_distance=8, max_x_distance=0)
 
-        doc.close()
+                page_dict['picture_signature'] = self.merge_rects(page_dict['picture_signature'], max_y_distance=5,
+                                                                  max_x_distance=0)
+                page_data.append(page_dict)
         return page_data
 
     def merge_rects(self, rectangles, max_y_distance=10, max_x_distance=20, check_indent_diff=False, max_difference=40):
@@ -510,15 +512,13 @@ class DocumentAnalyzer:
     def tables_find(self, file_path):
         """Находит таблицы в документе и возвращает их координаты по страницам."""
         tables = {}
-        doc = pymupdf.open(file_path)
-
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            tabs = page.find_tables()  # Находим таблицы на текущей странице
-            coordinates = [tab.bbox for tab in tabs]  # Получаем координаты таблиц
-            if coordinates:
-                tables[page_num] = coordinates
-        doc.close()
+        with pymupdf.open(file_path) as doc:
+            for page_num in range(len(doc)):
+                page = doc[page_num]
+                tabs = page.find_tables()  # Находим таблицы на текущей странице
+                coordinates = [tab.bbox for tab in tabs]  # Получаем координаты таблиц
+                if coordinates:
+                    tables[page_num] = coordinates
         return tables
 
     def _is_within_table(self, bbox, table_bbox):
@@ -527,16 +527,11 @@ class DocumentAnalyzer:
         tx0, ty0, tx1, ty1 = table_bbox
         return bx0 >= tx0 and bx1 <= tx1 and by0 >= ty0 and by1 <= ty1
 
-    def generate_annotated_images(self, pdf_dir, output_dir):
-        """Генерирует аннотации, т.е. координаты элементов"""
-        os.makedirs(output_dir, exist_ok=True)
-
-        for pdf_file in os.listdir(pdf_dir):
-            if not pdf_file.endswith('.pdf'):
-                continue
-
-            pdf_path = os.path.join(pdf_dir, pdf_file)
-            doc = pymupdf.open(pdf_path)
+    def annotate_pdf(self, pdf_path, output_dir):
+        """Сохраняет картинки страниц с разметкой и JSON с координатами элементов, возвращает пути к ним."""
+        outputs = []
+        pdf_file = os.path.basename(pdf_path)
+        with pymupdf.open(pdf_path) as doc:
             page_data = self.extract_coordinates(pdf_path)
 
             for page_num, page_info in enumerate(page_data):
@@ -561,13 +556,41 @@ class DocumentAnalyzer:
                 json_path = os.path.join(output_dir, f'{os.path.splitext(pdf_file)[0]}_page_{page_num + 1}.json')
                 with open(json_path, 'w', encoding='utf-8') as f:
                     json.dump(page_info, f, indent=2)
+                outputs += [output_path, json_path]
+        return outputs
 
-            doc.close()
+    def generate_annotated_images(self, pdf_dir, output_dir, state=None):
+        """
+        Генерирует аннотации, т.е. координаты элементов.
+        С state (BuildState) размечаются только новые и изменившиеся PDF, а разметка удалённых PDF удаляется.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        pdf_paths = sorted(os.path.join(pdf_dir, f) for f in os.listdir(pdf_dir) if f.endswith('.pdf'))
+        if state is not None:
+            removed = state.prune(pdf_paths)
+            pdf_paths = state.pending(pdf_paths)
+            print(f"PDF к разметке: {len(pdf_paths)}, удалено устаревших разметок: {removed}")
+
+        try:
+            for pdf_path in pdf_paths:
+                try:
+                    # Свой анализатор на каждый PDF: размер шрифта и прошлый элемент не переходят между документами,
+                    # поэтому разметка не зависит от того, какие PDF попали в этот запуск
+                    outputs = DocumentAnalyzer().annotate_pdf(pdf_path, output_dir)
+                except Exception as e:
+                    print(f"Ошибка разметки {pdf_path}: {e}")
+                    continue
+                if state is not None:
+                    state.record(pdf_path, outputs)
+        finally:
+            if state is not None:
+                state.save()
 
 
 def main():
     analyzer = DocumentAnalyzer()
-    analyzer.generate_annotated_images(PDF_DIR, ANNOTATIONS_DIR)
+    state = BuildState('extract_annotations', ANNOTATIONS_VERSION)
+    analyzer.generate_annotated_images(PDF_DIR, ANNOTATIONS_DIR, state)
 
 
 if __name__ == "__main__":
@@ -1,16 +1,199 @@
+import argparse
+import glob
+import hashlib
+import json
 import os
 import sys
+from collections import Counter
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, as_completed
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from doc_generator.doc_generator import generate_document
+from doc_generator import doc_generator
+from doc_generator.doc_generator import (CHART_BANK_DIR, CHART_REUSE, LATEX_CSV, OMML_CACHE, TEXT_BANK, document_seed,
+                                         generate_document, get_context, list_assets)
 from tqdm import tqdm
+from build_state import file_hash
 
 DOCX_DIR = 'data/docx/'
-os.makedirs(DOCX_DIR, exist_ok=True)
+MANIFEST_DIR = 'data/manifests/'
 
-NUM_DOCUMENTS = 1  # ПОМЕНЯТЬ НА 200 ПРИ ОСНОВНОЙ ГЕНЕРАЦИИ
+NUM_DOCUMENTS = 1000  # Общее число документов во всех шардах
 
-NUM_OF_ALREADY_DONE_DOCS = 250  # ПОКА НЕИЗВЕСТНО, ПОСТАВЛЕНО ЗАРАНЕЕ 250
+SEED = 0  # Базовый сид: документ i всегда получает сид document_seed(SEED, i)
 
-for i in tqdm(range(NUM_OF_ALREADY_DONE_DOCS, NUM_OF_ALREADY_DONE_DOCS + NUM_DOCUMENTS), desc="Генерация документов"):
-    doc_path = os.path.join(DOCX_DIR, f'demo{i}.docx')
-    generate_document(doc_path)
\ No newline at end of file
+
+def generator_version(chart_reuse=CHART_REUSE, text_bank=None):
+    """
+    Версия генерации: хэш кода генератора, его параметров и всех данных, от которых зависит DOCX
+    (таблица формул, кэш OMML, банк графиков при chart_reuse > 0, банк текста при text_bank).
+    После правки генератора, смены параметров или пересборки банка документы генерируются заново.
+    """
+    parts = {'code': file_hash(doc_generator.__file__), 'chart_reuse': chart_reuse, 'text_bank': bool(text_bank)}
+    inputs = [LATEX_CSV, OMML_CACHE]
+    if chart_reuse > 0:
+        inputs += [os.path.join(CHART_BANK_DIR, name) for name in list_assets(CHART_BANK_DIR) if name.endswith('.png')]
+    if text_bank:
+        inputs.append(text_bank)
+    for path in inputs:
+        parts[path] = file_hash(path) if os.path.exists(path) else None
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def generate_one(index, seed=SEED, docx_dir=DOCX_DIR):
+    doc_path = os.path.join(docx_dir, f'demo{index}.docx')
+    generate_document(doc_path, seed=document_seed(seed, index))
+    return doc_path
+
+
+def parse_shard(spec):
+    """'i/n' -> (i, n): шард с номером i из n, нумерация с нуля."""
+    try:
+        index, count = (int(part) for part in spec.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Шард задаётся как i/n, получено: {spec}")
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"Номер шарда должен быть от 0 до {count - 1}: {spec}")
+    return index, count
+
+
+def shard_ids(start, num_documents, shard_index, shard_count):
+    """Номера документов шарда: непрерывный кусок, шарды не пересекаются и вместе покрывают весь диапазон."""
+    return range(start + num_documents * shard_index // shard_count,
+                 start + num_documents * (shard_index + 1) // shard_count)
+
+
+def manifest_path(manifest_dir, shard_index, shard_count):
+    return os.path.join(manifest_dir, f'shard_{shard_index:04d}_of_{shard_count:04d}.jsonl')
+
+
+def read_manifest(path):
+    """Последняя запись по каждому документу из JSONL-манифеста."""
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Недописанная строка, если процесс убили во время записи
+            records[record['id']] = record
+    return records
+
+
+class ShardManifest:
+    """
+    Манифест шарда в JSONL: номер документа, сид, путь, версия генерации и статус (pending / done / failed).
+    Записи только дописываются, для каждого документа действует последняя. После каждого
+    документа файл сбрасывается на диск, поэтому убитый запуск продолжается с того же места.
+    """
+
+    def __init__(self, path, version):
+        self.path = path
+        self.version = version  # generator_version() этого запуска
+        self.records = read_manifest(path)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def is_done(self, doc_id, seed, require_file=True):
+        """Документ сгенерирован с этим сидом и той же версией генерации (require_file -- и файл на месте)."""
+        record = self.records.get(doc_id)
+        return (record is not None and record['status'] == 'done' and record['seed'] == seed
+                and record.get('version') == self.version and (not require_file or os.path.exists(record['path'])))
+
+    def write(self, doc_id, seed, path, status, error=None):
+        record = {'id': doc_id, 'seed': seed, 'path': path, 'status': status, 'version': self.version}
+        if error is not None:
+            record['error'] = error
+        self.records[doc_id] = record
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+def generate_shard(start, num_documents, shard=(0, 1), workers=None, seed=SEED, docx_dir=DOCX_DIR,
+                   manifest_dir=MANIFEST_DIR, chart_reuse=CHART_REUSE, text_bank=None):
+    """
+    Генерирует документы своего шарда из demo{start}..demo{start + num_documents - 1}.
+    У каждого документа свой сид, поэтому результат не зависит от числа процессов, узлов и порядка генерации.
+    Документы, готовые по манифесту шарда тем же сидом и той же версией генерации (generator_version), пропускаются.
+    chart_reuse -- доля графиков из банка scripts/build_chart_bank.py (0 -- все графики рисуются заново).
+    text_bank -- путь к банку текста scripts/build_text_bank.py (None -- текст генерируется на лету).
+    """
+    os.makedirs(docx_dir, exist_ok=True)
+    shard_index, shard_count = shard
+    manifest = ShardManifest(manifest_path(manifest_dir, shard_index, shard_count),
+                             generator_version(chart_reuse, text_bank))
+    seeds = {i: document_seed(seed, i) for i in shard_ids(start, num_documents, shard_index, shard_count)}
+    paths = {i: os.path.join(docx_dir, f'demo{i}.docx') for i in seeds}
+    todo = [i for i in seeds if not manifest.is_done(i, seeds[i])]
+    for i in todo:
+        if i not in manifest.records:
+            manifest.write(i, seeds[i], paths[i], 'pending')
+    print(f"Шард {shard_index}/{shard_count}: документов {len(seeds)}, осталось сгенерировать {len(todo)}")
+
+    def finish(i, get_path):
+        try:
+            manifest.write(i, seeds[i], get_path(), 'done')
+        except Exception as e:
+            print(f"Ошибка генерации документа demo{i}: {e}")
+            manifest.write(i, seeds[i], paths[i], 'failed', str(e))
+
+    init_context = partial(get_context, chart_reuse=chart_reuse, text_bank=text_bank)
+    try:
+        if workers == 1:
+            init_context()
+            for i in tqdm(todo, desc="Генерация документов"):
+                finish(i, partial(generate_one, i, seed, docx_dir))
+            return
+
+        # Контекст генератора (формулы, провайдеры Faker/mimesis) создаётся в каждом процессе один раз при старте
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_context) as executor:
+            futures = {executor.submit(generate_one, i, seed, docx_dir): i for i in todo}
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Генерация документов"):
+                finish(futures[future], future.result)
+    finally:
+        manifest.close()
+
+
+def merge_manifests(manifest_dir=MANIFEST_DIR):
+    """Сводит манифесты всех шардов (например, собранные с разных узлов) в один manifest.jsonl."""
+    records = {}
+    for path in sorted(glob.glob(os.path.join(manifest_dir, 'shard_*.jsonl'))):
+        records.update(read_manifest(path))
+    output_path = os.path.join(manifest_dir, 'manifest.jsonl')
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for doc_id in sorted(records):
+            f.write(json.dumps(records[doc_id], ensure_ascii=False) + '\n')
+    statuses = Counter(record['status'] for record in records.values())
+    print(f"Документов в {output_path}: {len(records)}, по статусам: {dict(statuses)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Генерация синтетических DOCX-документов")
+    parser.add_argument("--num-documents", type=int, default=NUM_DOCUMENTS, help="Общее число документов во всех шардах")
+    parser.add_argument("--start", type=int, default=0, help="Номер первого документа")
+    parser.add_argument("--shard", type=parse_shard, default=(0, 1),
+                        help="Шард i/n: этот запуск генерирует i-ю из n частей документов (по умолчанию 0/1 -- все)")
+    parser.add_argument("--workers", type=int, default=None, help="Число процессов (по умолчанию все ядра)")
+    parser.add_argument("--seed", type=int, default=SEED, help="Базовый сид генерации")
+    parser.add_argument("--output-dir", default=DOCX_DIR)
+    parser.add_argument("--manifest-dir", default=MANIFEST_DIR)
+    parser.add_argument("--merge", action="store_true", help="Только свести манифесты шардов в manifest.jsonl")
+    parser.add_argument("--chart-reuse", type=float, default=CHART_REUSE,
+                        help="Доля графиков из банка готовых графиков (0 -- рисовать все заново)")
+    parser.add_argument("--text-bank", action="store_true", help="Брать текст из банка scripts/build_text_bank.py")
+    args = parser.parse_args()
+
+    if args.merge:
+        merge_manifests(args.manifest_dir)
+        return
+    generate_shard(args.start, args.num_documents, args.shard, args.workers, args.seed, args.output_dir,
+                   args.manifest_dir, args.chart_reuse, TEXT_BANK if args.text_bank else None)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,47 @@
 import os
 import fitz
 from tqdm import tqdm
+from build_state import BuildState
 
 PDF_DIR = 'data/pdf/'
 IMAGE_DIR = 'data/images/'
-os.makedirs(IMAGE_DIR, exist_ok=True)
+DPI = 300
+IMAGES_VERSION = f"pymupdf {fitz.VersionBind}, dpi {DPI}"  # Версия стадии для BuildState
 
-pdf_files = [f for f in os.listdir(PDF_DIR) if f.endswith('.pdf')]
 
-for pdf_file in tqdm(pdf_files, desc="Конвертация PDF в изображения"):
-    pdf_path = os.path.join(PDF_DIR, pdf_file)
+def pdf_to_images(pdf_path, image_dir=IMAGE_DIR, dpi=DPI):
+    """Сохраняет страницы PDF в PNG и возвращает пути к ним."""
+    outputs = []
+    doc = fitz.open(pdf_path)
     try:
-        doc = fitz.open(pdf_path)
         for page_num in range(len(doc)):
             page = doc.load_page(page_num)
-            pix = page.get_pixmap(dpi=300)
-            image_name = f"{os.path.splitext(pdf_file)[0]}_{page_num + 1}.png"
-            pix.save(os.path.join(IMAGE_DIR, image_name))
+            pix = page.get_pixmap(dpi=dpi)
+            image_name = f"{os.path.splitext(os.path.basename(pdf_path))[0]}_{page_num + 1}.png"
+            pix.save(os.path.join(image_dir, image_name))
+            outputs.append(os.path.join(image_dir, image_name))
+    finally:
         doc.close()
-    except Exception as e:
-        print(f"Ошибка конвертации {pdf_file}: {e}")
\ No newline at end of file
+    return outputs
+
+
+def main():
+    os.makedirs(IMAGE_DIR, exist_ok=True)
+    pdf_paths = sorted(os.path.join(PDF_DIR, f) for f in os.listdir(PDF_DIR) if f.endswith('.pdf'))
+
+    # Обрабатываются только новые и изменившиеся PDF, картинки удалённых PDF удаляются
+    state = BuildState('pdf_to_images', IMAGES_VERSION)
+    removed = state.prune(pdf_paths)
+    todo = state.pending(pdf_paths)
+    print(f"PDF: {len(pdf_paths)}, к обработке: {len(todo)}, удалено устаревших: {removed}")
+
+    for pdf_path in tqdm(todo, desc="Конвертация PDF в изображения"):
+        try:
+            state.record(pdf_path, pdf_to_images(pdf_path))
+        except Exception as e:
+            print(f"Ошибка конвертации {pdf_path}: {e}")
+    state.save()
+
+
+if __name__ == "__main__":
+    main()
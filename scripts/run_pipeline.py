@@ -0,0 +1,341 @@
+import argparse
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from tqdm import tqdm
+
+from build_state import BuildState
+from generate_documents import (DOCX_DIR, MANIFEST_DIR, NUM_DOCUMENTS, SEED, ShardManifest, generate_one,
+                                generator_version, manifest_path)
+from convert_to_pdf_linux import (FILE_TIMEOUT, OFFICE_PORT, PDF_DIR, PROFILES_DIR, SOFFICE, ConversionPool,
+                                  convert_chunk, office_version, pdf_path, uno)
+from pdf_to_images import DPI, IMAGE_DIR, IMAGES_VERSION, pdf_to_images
+from extract_annotations import ANNOTATIONS_DIR, ANNOTATIONS_VERSION, DocumentAnalyzer
+from doc_generator.doc_generator import CHART_REUSE, TEXT_BANK, document_seed, get_context
+
+QUEUE_SIZE = 32  # Сколько файлов может ждать между стадиями, дальше предыдущая стадия притормаживает
+CPU_COUNT = os.cpu_count() or 1
+
+
+def annotate(pdf_path, annotations_dir=ANNOTATIONS_DIR):
+    # Анализатор запоминает размер шрифта и прошлый элемент, поэтому у каждого PDF свой:
+    # иначе разметка зависела бы от того, какие PDF раньше попали в тот же процесс
+    return DocumentAnalyzer().annotate_pdf(pdf_path, annotations_dir)
+
+
+def up_to_date(state, input_path):
+    """Вход не нужно обрабатывать заново; удалённый промежуточный файл проверяется только по записи в state."""
+    if os.path.exists(input_path):
+        return not state.needs_build(input_path)
+    return state.is_recorded(input_path)
+
+
+class Stage:
+    """
+    Стадия конвейера: threads потоков берут файлы из inbox, обрабатывают их func (в пуле процессов executor,
+    если он задан) и кладут результат в outbox. None в очереди означает конец данных.
+    Очереди ограничены, поэтому быстрая стадия ждёт медленную, а не копит файлы на диске.
+
+    skip(item) возвращает то, что передать дальше, если item уже обработан (иначе None);
+    done(item, result) записывает результат в состояние сборки и возвращает то, что передать дальше.
+    """
+
+    def __init__(self, name, func, inbox, outbox, threads, executor=None, skip=None, done=None, total=None,
+                 position=0):
+        self.name = name
+        self.func = func
+        self.inbox = inbox
+        self.outbox = outbox
+        self.executor = executor
+        self.skip = skip
+        self.done = done
+        self.failed = 0
+        self.skipped = 0
+        self.progress = tqdm(total=total, desc=f"{name:<12}", position=position, unit='док')
+        self._active = threads
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._run, daemon=True) for _ in range(threads)]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def _process(self, item):
+        forward = self.skip(item) if self.skip else None
+        if forward is not None:
+            with self._lock:
+                self.skipped += 1
+            return forward
+        result = self.executor.submit(self.func, item).result() if self.executor else self.func(item)
+        return self.done(item, result) if self.done else result
+
+    def _run(self):
+        while True:
+            item = self.inbox.get()
+            if item is None:
+                self.inbox.put(None)  # Конец очереди видят и остальные потоки стадии
+                break
+            try:
+                forward = self._process(item)
+            except Exception as e:
+                tqdm.write(f"{self.name}: ошибка на {item}: {e}")
+                with self._lock:
+                    self.failed += 1
+                continue
+            finally:
+                self.progress.update(1)
+            if self.outbox is not None:
+                self.outbox.put(forward)
+        self._finish()
+
+    def _finish(self):
+        with self._lock:
+            self._active -= 1
+            last = self._active == 0
+        if last and self.outbox is not None:
+            self.outbox.put(None)
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+        self.progress.close()
+
+
+class ConvertStage(Stage):
+    """Стадия конвертации через пул офисов ConversionPool (нужен python3-uno)."""
+
+    def __init__(self, pool, pdf_dir, inbox, outbox, skip=None, done=None, total=None, position=0):
+        super().__init__("convert", None, inbox, outbox, threads=1, skip=skip, done=done, total=total,
+                         position=position)
+        self.pool = pool
+        self.pdf_dir = pdf_dir
+        self._tasks = queue.Queue(maxsize=inbox.maxsize)  # Только файлы, которые действительно нужно конвертировать
+
+    def _filter(self):
+        while (item := self.inbox.get()) is not None:
+            forward = self.skip(item) if self.skip else None
+            if forward is None:
+                self._tasks.put(item)
+                continue
+            with self._lock:
+                self.skipped += 1
+            self.progress.update(1)
+            self.outbox.put(forward)
+        self._tasks.put(None)
+
+    def _on_done(self, input_path, output_path):
+        self.progress.update(1)
+        try:
+            if output_path is None:
+                raise RuntimeError("PDF не создан")
+            forward = self.done(input_path, output_path) if self.done else output_path
+        except Exception as e:
+            tqdm.write(f"convert: ошибка на {input_path}: {e}")
+            with self._lock:
+                self.failed += 1
+            return
+        self.outbox.put(forward)
+
+    def _run(self):
+        feeder = threading.Thread(target=self._filter, daemon=True)
+        feeder.start()
+        self.pool.serve(self._tasks, self.pdf_dir, self._on_done)
+        # Если офисы упали и не перезапустились, дочитываем очередь, чтобы не заблокировать генерацию
+        while (item := self._tasks.get()) is not None:
+            tqdm.write(f"convert: не сконвертирован {item}")
+            with self._lock:
+                self.failed += 1
+        feeder.join()
+        self._finish()
+
+
+def office_fallback(soffice, pdf_dir, profiles_dir, workers, timeout):
+    """Конвертация одного файла вызовом --convert-to, когда UNO нет: у каждого потока свой профиль."""
+    free_profiles = queue.Queue()
+    for worker_id in range(workers):
+        free_profiles.put(os.path.join(profiles_dir, f'worker_{worker_id}'))
+
+    def convert(input_path):
+        profile_dir = free_profiles.get()
+        try:
+            failed = convert_chunk([input_path], pdf_dir, soffice, profile_dir, timeout)
+        finally:
+            free_profiles.put(profile_dir)
+        if failed:
+            raise RuntimeError("PDF не создан")
+        return pdf_path(input_path, pdf_dir)
+
+    return convert
+
+
+class PipelineState:
+    """
+    Состояние сборки для всех стадий: манифест генерации (тот же, что у generate_documents.py без шардов)
+    и BuildState конвертации, растеризации и разметки (те же, что у отдельных скриптов).
+    Поэтому повторный запуск конвейера, как и отдельных скриптов, делает только недостающую работу.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        text_bank = TEXT_BANK if args.text_bank else None
+        self.manifest = ShardManifest(manifest_path(args.manifest_dir, 0, 1),
+                                      generator_version(args.chart_reuse, text_bank))
+        self.convert = BuildState('convert_to_pdf', office_version(args.soffice))
+        self.images = BuildState('pdf_to_images', IMAGES_VERSION)
+        self.annotations = BuildState('extract_annotations', ANNOTATIONS_VERSION)
+        self._manifest_lock = threading.Lock()
+
+    def seed(self, index):
+        return document_seed(self.args.seed, index)
+
+    def docx_path(self, index):
+        return os.path.join(self.args.docx_dir, f'demo{index}.docx')
+
+    def pdf_path(self, docx_path):
+        return pdf_path(docx_path, self.args.pdf_dir)
+
+    def is_complete(self, index):
+        """Документ прошёл все стадии текущими версиями инструментов, включая удалённые промежуточные файлы."""
+        docx = self.docx_path(index)
+        pdf = self.pdf_path(docx)
+        return (self.manifest.is_done(index, self.seed(index), require_file=False)
+                and up_to_date(self.convert, docx) and up_to_date(self.images, pdf)
+                and up_to_date(self.annotations, pdf))
+
+    # Генерация
+    def skip_generate(self, index):
+        if self.manifest.is_done(index, self.seed(index)):
+            return self.docx_path(index)
+
+    def done_generate(self, index, docx):
+        with self._manifest_lock:
+            self.manifest.write(index, self.seed(index), docx, 'done')
+        return docx
+
+    # Конвертация
+    def skip_convert(self, docx):
+        if up_to_date(self.convert, docx):
+            self.remove_intermediate(docx)
+            return self.pdf_path(docx)
+
+    def done_convert(self, docx, pdf):
+        self.convert.record(docx, [pdf])
+        self.remove_intermediate(docx)
+        return pdf
+
+    # Растеризация
+    def skip_rasterize(self, pdf):
+        return pdf if up_to_date(self.images, pdf) else None
+
+    def done_rasterize(self, pdf, outputs):
+        self.images.record(pdf, outputs)
+        return pdf
+
+    # Разметка: PDF удаляется только после неё, растеризация к этому моменту уже прошла
+    def skip_annotate(self, pdf):
+        if up_to_date(self.annotations, pdf):
+            self.remove_intermediate(pdf)
+            return pdf
+
+    def done_annotate(self, pdf, outputs):
+        self.annotations.record(pdf, outputs)
+        self.remove_intermediate(pdf)
+        return pdf
+
+    def remove_intermediate(self, path):
+        if self.args.delete_intermediates and os.path.exists(path):
+            os.remove(path)
+
+    def save(self):
+        self.manifest.close()
+        for state in (self.convert, self.images, self.annotations):
+            state.save()
+
+
+def run_pipeline(args):
+    for directory in (args.docx_dir, args.pdf_dir, args.image_dir, args.annotations_dir):
+        os.makedirs(directory, exist_ok=True)
+    state = PipelineState(args)
+    ids = [i for i in range(args.start, args.start + args.num_documents) if not state.is_complete(i)]
+    total = len(ids)
+    print(f"Документов: {args.num_documents}, уже готово: {args.num_documents - total}, к обработке: {total}")
+
+    indices, docx_queue, pdf_queue, rasterized_queue = (queue.Queue(maxsize=args.queue_size) for _ in range(4))
+    init_context = partial(get_context, chart_reuse=args.chart_reuse, text_bank=TEXT_BANK if args.text_bank else None)
+    executors = [
+        ProcessPoolExecutor(args.generate_workers, initializer=init_context),
+        ProcessPoolExecutor(args.rasterize_workers),
+        ProcessPoolExecutor(args.annotate_workers),
+    ]
+
+    stages = [Stage("generate", partial(generate_one, seed=args.seed, docx_dir=args.docx_dir), indices, docx_queue,
+                    args.generate_workers, executors[0], state.skip_generate, state.done_generate, total, position=0)]
+    if uno is not None:
+        pool = ConversionPool(args.convert_workers, args.soffice, args.port, args.profiles_dir, args.timeout)
+        stages.append(ConvertStage(pool, args.pdf_dir, docx_queue, pdf_queue, state.skip_convert, state.done_convert,
+                                   total, position=1))
+    else:
+        tqdm.write("Модуль uno не найден: каждый файл конвертируется отдельным запуском LibreOffice")
+        convert = office_fallback(args.soffice, args.pdf_dir, args.profiles_dir, args.convert_workers, args.timeout)
+        stages.append(Stage("convert", convert, docx_queue, pdf_queue, args.convert_workers, None, state.skip_convert,
+                            state.done_convert, total, position=1))
+    stages.append(Stage("rasterize", partial(pdf_to_images, image_dir=args.image_dir, dpi=DPI), pdf_queue,
+                        rasterized_queue, args.rasterize_workers, executors[1], state.skip_rasterize,
+                        state.done_rasterize, total, position=2))
+    stages.append(Stage("annotate", partial(annotate, annotations_dir=args.annotations_dir), rasterized_queue, None,
+                        args.annotate_workers, executors[2], state.skip_annotate, state.done_annotate, total,
+                        position=3))
+
+    for stage in stages:
+        stage.start()
+    try:
+        for i in ids:
+            indices.put(i)
+        indices.put(None)
+        for stage in stages:
+            stage.join()
+    finally:
+        for executor in executors:
+            executor.shutdown(cancel_futures=True)
+        state.save()
+
+    print()
+    for stage in stages:
+        print(f"{stage.name}: обработано {stage.progress.n}, из них пропущено готовых {stage.skipped}, "
+              f"ошибок {stage.failed}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Конвейер генерация -> DOCX в PDF -> картинки -> разметка, стадии работают одновременно")
+    parser.add_argument("--num-documents", type=int, default=NUM_DOCUMENTS)
+    parser.add_argument("--start", type=int, default=0, help="Номер первого документа")
+    parser.add_argument("--seed", type=int, default=SEED, help="Базовый сид генерации")
+    parser.add_argument("--generate-workers", type=int, default=max(1, CPU_COUNT // 2))
+    parser.add_argument("--convert-workers", type=int, default=max(1, CPU_COUNT // 4))
+    parser.add_argument("--rasterize-workers", type=int, default=max(1, CPU_COUNT // 8))
+    parser.add_argument("--annotate-workers", type=int, default=max(1, CPU_COUNT // 8))
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="Размер очередей между стадиями")
+    parser.add_argument("--delete-intermediates", action="store_true",
+                        help="Удалять DOCX после конвертации и PDF после разметки")
+    parser.add_argument("--docx-dir", default=DOCX_DIR)
+    parser.add_argument("--pdf-dir", default=PDF_DIR)
+    parser.add_argument("--image-dir", default=IMAGE_DIR)
+    parser.add_argument("--annotations-dir", default=ANNOTATIONS_DIR)
+    parser.add_argument("--manifest-dir", default=MANIFEST_DIR)
+    parser.add_argument("--chart-reuse", type=float, default=CHART_REUSE)
+    parser.add_argument("--text-bank", action="store_true", help="Брать текст из банка scripts/build_text_bank.py")
+    parser.add_argument("--soffice", default=SOFFICE, help="Команда запуска LibreOffice")
+    parser.add_argument("--port", type=int, default=OFFICE_PORT, help="Порт первого офиса, у остальных следующие")
+    parser.add_argument("--profiles-dir", default=PROFILES_DIR)
+    parser.add_argument("--timeout", type=float, default=FILE_TIMEOUT, help="Лимит времени на конвертацию файла, секунды")
+    args = parser.parse_args()
+
+    run_pipeline(args)
+
+
+if __name__ == "__main__":
+    main()